@@ -1,8 +1,10 @@
 from django.contrib import admin
 
 from cards.models import (
+    DeliveryLog,
     Guest,
     Invitation,
+    InvitationDispatch,
     QRVerification,
     User,
     WeddingEvent,
@@ -30,6 +32,16 @@ class InvitationAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(DeliveryLog)
+class DeliveryLogAdmin(admin.ModelAdmin):
+    pass
+
+
+@admin.register(InvitationDispatch)
+class InvitationDispatchAdmin(admin.ModelAdmin):
+    pass
+
+
 @admin.register(Guest)
 class GuestAdmin(admin.ModelAdmin):
     pass
@@ -1,10 +1,15 @@
 # cards/allauth.py
+import logging
 import typing
-from django.contrib import messages
 from allauth.account.adapter import DefaultAccountAdapter
 from django.utils.text import slugify
+from kombu.exceptions import OperationalError
 import uuid
+from cards.mailing import SITE_NAME
 from cards.models import User
+from cards.tasks import send_sms
+
+logger = logging.getLogger(__name__)
 
 
 class AccountAdapter(DefaultAccountAdapter):
@@ -25,25 +30,29 @@ class AccountAdapter(DefaultAccountAdapter):
     def set_phone_verified(self, user, phone):
         self.set_phone(user, phone, True)
 
+    def _send_sms(self, phone: str, body: str):
+        try:
+            send_sms.delay(phone, body)
+        except OperationalError:
+            # Broker unreachable: the user is waiting for this message
+            logger.exception("Could not queue text message to %s", phone)
+            send_sms.apply(args=[phone, body])
+
     def send_verification_code_sms(self, user, phone: str, code: str, **kwargs):
-        messages.add_message(
-            self.request,
-            messages.WARNING,
-            f"⚠️ SMS demo stub: assume code {code} was sent to {phone}.",
-        )
+        self._send_sms(phone, f"Your {SITE_NAME} verification code is {code}.")
 
     def send_unknown_account_sms(self, phone: str, **kwargs):
-        messages.add_message(
-            self.request,
-            messages.WARNING,
-            f"⚠️ SMS demo stub: Enumeration prevention: texted {phone} informing no account exists.",
+        self._send_sms(
+            phone,
+            f"Someone tried to sign in to {SITE_NAME} with this number, but it has no "
+            "account. If this wasn't you, ignore this message.",
         )
 
     def send_account_already_exists_sms(self, phone: str, **kwargs):
-        messages.add_message(
-            self.request,
-            messages.WARNING,
-            f"⚠️ SMS demo stub: Enumeration prevention: texted {phone} informing account already exists.",
+        self._send_sms(
+            phone,
+            f"Someone tried to sign up to {SITE_NAME} with this number, but it already has "
+            "an account. Sign in instead, or ignore this message if this wasn't you.",
         )
 
     def get_user_by_phone(self, phone):
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from django.contrib.auth import get_user_model
 
 from cards.serierizers import CustomAuthTokenSerializer
+from .checkin import check_in_guest
 from .models import WeddingPlanner, WeddingEvent, Invitation, Guest, QRVerification
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -100,6 +101,7 @@ class InvitationSerializer(serializers.ModelSerializer):
 class GuestSerializer(serializers.ModelSerializer):
     invitation = InvitationSerializer(read_only=True)
     invitation_id = serializers.UUIDField(write_only=True)
+    card_srcset = serializers.CharField(read_only=True)
 
     class Meta:
         model = Guest
@@ -115,14 +117,21 @@ class GuestSerializer(serializers.ModelSerializer):
             "checked_in",
             "check_in_time",
             "card_image",
+            "card_thumbnail",
+            "card_preview",
+            "card_srcset",
             "qr_code",
+            "render_status",
             "guest_name",
         ]
         read_only_fields = [
             "id",
             "check_in_time",
             "card_image",
+            "card_thumbnail",
+            "card_preview",
             "qr_code",
+            "render_status",
             "first_name",
             "last_name",
             "email",
@@ -254,16 +263,19 @@ class QRVerificationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(
             guest__invitation__event__planner__user=self.request.user
-        )
+        ).select_related("guest")
 
     @action(detail=True, methods=["post"])
     def verify(self, request, pk=None):
         verification = self.get_object()
-        verification.is_valid = True
-        verification.guest.checked_in = True
-        verification.guest.check_in_time = verification.scanned_at
-        verification.guest.save()
-        verification.save()
+        if not check_in_guest(verification.guest, verification=verification):
+            return Response(
+                {
+                    "error": "Guest is already checked in",
+                    "guest": GuestSerializer(verification.guest).data,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         return Response(
             {"status": "verified", "guest": GuestSerializer(verification.guest).data}
         )
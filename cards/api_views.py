@@ -1,15 +1,22 @@
 from rest_framework import viewsets, status, permissions, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.authtoken.views import ObtainAuthToken
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
-from django.utils.timezone import now
+from django.utils.cache import get_conditional_response
 from django.db.models import Count
 
+from utils.generators import get_event_schedules, get_invitee_name
+from .checkin import check_in_guest
+from .importers import GuestImportError, import_guests, read_guest_rows
 from .models import (
     WeddingEvent, WeddingPlanner, Invitation, Guest, 
     EventSchedule, QRVerification, User
 )
+from .rendering import card_render_mode, ensure_guest_card, guest_card_etag
+from .scheduler import render_metrics
 from .serierizers import (
     CustomAuthTokenSerializer, WeddingEventSerializer, WeddingEventCreateSerializer,
     WeddingPlannerSerializer, InvitationSerializer, GuestSerializer, GuestCreateSerializer,
@@ -135,6 +142,53 @@ class InvitationViewSet(viewsets.ReadOnlyModelViewSet):
         except WeddingPlanner.DoesNotExist:
             return Invitation.objects.none()
 
+    @action(detail=True, methods=['post'], url_path='import')
+    def import_guests(self, request, pk=None):
+        """Add guests in bulk from a CSV/JSON file upload or a JSON list.
+
+        Valid rows are added even when others fail; failures are reported
+        per row. Cards render in the background; poll ``progress``.
+        """
+        invitation = self.get_object()
+        upload = request.FILES.get('file')
+        try:
+            rows = read_guest_rows(
+                upload if upload else request.data,
+                filename=upload.name if upload else '',
+            )
+        except GuestImportError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        guests, errors = import_guests(invitation, rows, region=request.query_params.get('region'))
+        return Response(
+            {
+                'created': len(guests),
+                'failed_rows': len({error['row'] for error in errors}),
+                'errors': errors,
+                'guest_ids': [guest.id for guest in guests],
+                'progress': self._render_progress(invitation),
+            },
+            status=status.HTTP_201_CREATED if guests else status.HTTP_400_BAD_REQUEST,
+        )
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """Card render progress for an invitation's guests"""
+        return Response(self._render_progress(self.get_object()))
+
+    def _render_progress(self, invitation):
+        counts = dict(
+            invitation.guests.order_by()
+            .values_list('render_status')
+            .annotate(count=Count('id'))
+        )
+        progress = {
+            render_status: counts.get(render_status, 0)
+            for render_status, _ in Guest._meta.get_field('render_status').choices
+        }
+        progress['total'] = sum(counts.values())
+        return progress
+
 
 class GuestViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -166,56 +220,44 @@ class GuestViewSet(viewsets.ModelViewSet):
     def check_in(self, request, pk=None):
         """Check in a guest"""
         guest = self.get_object()
-        if guest.checked_in:
+        if not check_in_guest(guest):
             return Response(
                 {'error': 'Guest is already checked in'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        guest.checked_in = True
-        guest.check_in_time = now()
-        guest.save()
-        
-        # Create QR verification record
-        QRVerification.objects.get_or_create(
-            guest=guest,
-            defaults={'is_valid': True, 'scanned_at': now()}
-        )
-        
         return Response(GuestSerializer(guest).data)
 
+    @action(detail=True, methods=['get'])
+    def card(self, request, pk=None):
+        """Get the card image for a guest, rendering it on first request"""
+        guest = self.get_object()
+        if not guest.card_image and card_render_mode() != "lazy":
+            # Still queued or rendering in the background
+            return Response(
+                {'render_status': guest.render_status},
+                status=status.HTTP_202_ACCEPTED,
+            )
+        card_etag = guest_card_etag(guest)
+
+        response = get_conditional_response(request, etag=card_etag)
+        if response is None:
+            guest = ensure_guest_card(guest)
+            response = FileResponse(guest.card_image.open("rb"))
+        response["ETag"] = card_etag
+        return response
+
     @action(detail=True, methods=['get'])
     def card_info(self, request, pk=None):
         """Get card generation information for a guest"""
         guest = self.get_object()
         
-        # Get multiple events if available
-        event_schedules = guest.invitation.event.event_schedules.all()
-        events_data = []
-        
-        if event_schedules.exists():
-            for schedule in event_schedules:
-                events_data.append({
-                    'name': schedule.event_name,
-                    'date': schedule.date.strftime("%A, %B %d, %Y"),
-                    'time': schedule.date.strftime("%I:%M %p"),
-                    'location': schedule.location,
-                    'description': schedule.description or ''
-                })
-        
-        # Get invitee name
-        invitee_name = None
-        if guest.guest_name:
-            invitee_name = guest.guest_name
-        elif guest.first_name and guest.last_name:
-            invitee_name = f"{guest.first_name} {guest.last_name}"
-        elif guest.first_name:
-            invitee_name = guest.first_name
-        
+        events = get_event_schedules(guest.invitation.event)
+        invitee_name = get_invitee_name(guest)
+
         return Response({
             'guest': GuestSerializer(guest).data,
             'invitee_name': invitee_name,
-            'events': events_data if len(events_data) > 1 else None,
+            'events': events,
             'payment_amount': float(guest.payment_amount) if guest.payment_amount else None,
             'card_image_url': guest.card_image.url if guest.card_image else None,
             'qr_code_url': guest.qr_code.url if guest.qr_code else None
@@ -253,24 +295,20 @@ class QRVerificationViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Check if already verified
-        if QRVerification.objects.filter(guest=guest).exists():
+        if not check_in_guest(guest):
             return Response(
                 {'error': 'Guest already verified', 'guest': GuestSerializer(guest).data},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Create verification and update guest
-        QRVerification.objects.create(
-            guest=guest,
-            is_valid=True,
-            scanned_at=now()
-        )
-        guest.checked_in = True
-        guest.check_in_time = now()
-        guest.save()
-        
         return Response({
             'message': 'Guest verified successfully',
             'guest': GuestSerializer(guest).data
-        })
\ No newline at end of file
+        })
+
+class RenderMetricsView(APIView):
+    """Card render queue depth and wait times, for monitoring"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(render_metrics())
@@ -0,0 +1,39 @@
+from django.utils.timezone import now
+
+from .models import Guest, QRVerification
+
+
+def check_in_guest(guest, verification=None):
+    """Check ``guest`` in at the door, at most once.
+
+    The guest row is flipped with one conditional UPDATE, so of two
+    devices scanning the same card at once only one gets it; the other
+    sees the guest as already checked in. The winner then records the
+    scan: a new valid ``QRVerification``, or, if the guest already has one
+    (``unique_qrverification_guest``), that one marked valid in the same
+    statement; or ``verification`` marked valid.
+
+    Returns True if this call checked the guest in. Either way ``guest``
+    is left holding the stored check-in time. Two queries at most.
+    """
+    checked_in_at = now()
+    updated = Guest.objects.filter(pk=guest.pk, checked_in=False).update(
+        checked_in=True, check_in_time=checked_in_at
+    )
+    if not updated:
+        guest.refresh_from_db(fields=["checked_in", "check_in_time"])
+        return False
+
+    guest.checked_in = True
+    guest.check_in_time = checked_in_at
+    if verification is not None:
+        QRVerification.objects.filter(pk=verification.pk).update(is_valid=True)
+        verification.is_valid = True
+    else:
+        QRVerification.objects.bulk_create(
+            [QRVerification(guest=guest, is_valid=True, scanned_at=checked_in_at)],
+            update_conflicts=True,
+            unique_fields=["guest"],
+            update_fields=["is_valid"],
+        )
+    return True
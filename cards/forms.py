@@ -143,7 +143,7 @@ class GuestForm(forms.ModelForm):
 class WeddingEventForm(forms.ModelForm):
     class Meta:
         model = WeddingEvent
-        fields = ["title", "date", "venue", "description", "couple"]
+        fields = ["title", "date", "venue", "description", "couple", "card_format"]
         widgets = {
             "title": forms.TextInput(attrs={"placeholder": "Enter event title"}),
             "date": forms.DateTimeInput(
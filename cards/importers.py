@@ -0,0 +1,206 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from typing import Optional
+
+import phonenumbers
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from pydantic import BaseModel, ConfigDict, Field, ValidationInfo, field_validator, model_validator
+from pydantic import ValidationError as RowValidationError
+from pydantic_core import PydanticCustomError
+
+from .models import Guest
+from .rendering import card_render_mode
+from .scheduler import schedule_renders
+from .tasks import RERENDER_CHUNK_SIZE, render_guest_card_batch
+
+IMPORT_MAX_ROWS = 5000
+IMPORT_BATCH_SIZE = 500
+PHONE_MAX_LENGTH = Guest._meta.get_field("phone").max_length
+
+
+class GuestImportError(ValueError):
+    """The upload as a whole can't be read (as opposed to a bad row)."""
+
+
+class GuestRow(BaseModel):
+    """One guest of a bulk import, cleaned the way ``GuestForm`` would.
+
+    Phone numbers are parsed once and stored in E.164 form; numbers without
+    a country code are read as local to ``context["region"]``.
+    """
+
+    model_config = ConfigDict(str_strip_whitespace=True, extra="ignore")
+
+    guest_name: Optional[str] = Field(None, max_length=50)
+    first_name: Optional[str] = Field(None, max_length=50)
+    last_name: Optional[str] = Field(None, max_length=50)
+    email: Optional[str] = Field(None, max_length=254)
+    phone: Optional[str] = None
+    payment_amount: Optional[Decimal] = Field(None, ge=0, max_digits=10, decimal_places=2)
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def blank_to_none(cls, value):
+        if isinstance(value, str) and not value.strip():
+            return None
+        return value
+
+    @field_validator("email")
+    @classmethod
+    def check_email(cls, value):
+        if value is not None:
+            try:
+                validate_email(value)
+            except ValidationError:
+                raise PydanticCustomError("email", "Enter a valid email address.")
+        return value
+
+    @field_validator("phone")
+    @classmethod
+    def normalize_phone(cls, value, info: ValidationInfo):
+        if value is None:
+            return value
+        region = (info.context or {}).get("region")
+        try:
+            parsed = phonenumbers.parse(value, region)
+        except phonenumbers.NumberParseException:
+            parsed = None
+        if parsed is None or not phonenumbers.is_valid_number(parsed):
+            raise PydanticCustomError("phone", "Invalid phone number format.")
+        value = phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+        # E.164 allows 15 digits plus the "+", one more than Guest.phone holds
+        if len(value) > PHONE_MAX_LENGTH:
+            raise PydanticCustomError(
+                "phone",
+                "Phone numbers can have at most {max_length} characters.",
+                {"max_length": PHONE_MAX_LENGTH},
+            )
+        return value
+
+    @model_validator(mode="after")
+    def check_name(self):
+        if not (self.guest_name or self.first_name or self.last_name):
+            raise PydanticCustomError("name", "A guest name or first/last name is required.")
+        return self
+
+
+def _column(name):
+    return (name or "").strip().lower().replace(" ", "_")
+
+
+def read_guest_rows(data, filename=""):
+    """Turn an upload into a list of row dicts.
+
+    ``data`` is a CSV or JSON file (told apart by ``filename``), raw JSON
+    already parsed into a list, or a ``{"guests": [...]}`` object. CSV
+    headers are matched loosely, so "First Name" works for ``first_name``.
+    """
+    if hasattr(data, "read"):
+        raw = data.read()
+        text = raw.decode("utf-8-sig") if isinstance(raw, bytes) else raw
+        if filename.lower().endswith(".json"):
+            try:
+                data = json.loads(text)
+            except ValueError:
+                raise GuestImportError("The file is not valid JSON.")
+        else:
+            reader = csv.DictReader(io.StringIO(text))
+            if not reader.fieldnames:
+                raise GuestImportError("The CSV file has no header row.")
+            reader.fieldnames = [_column(name) for name in reader.fieldnames]
+            data = list(reader)
+
+    if isinstance(data, dict):
+        data = data.get("guests")
+    if not isinstance(data, list):
+        raise GuestImportError("Expected a list of guests.")
+    if len(data) > IMPORT_MAX_ROWS:
+        raise GuestImportError(f"At most {IMPORT_MAX_ROWS} guests can be imported at once.")
+    return data
+
+
+def _row_errors(row_number, exc):
+    errors = []
+    for error in exc.errors():
+        errors.append({
+            "row": row_number,
+            "field": ".".join(str(part) for part in error["loc"]) or None,
+            "message": error["msg"],
+        })
+    return errors
+
+
+def import_guests(invitation, rows, region=None):
+    """Validate ``rows`` and insert the good ones into ``invitation``.
+
+    Rows are numbered from 1, not counting a CSV header. Emails already on
+    the invitation, or earlier in the same upload, are rejected with one
+    query up front instead of one per row. Guests are inserted in batches;
+    as ``bulk_create`` skips ``post_save``, their cards are queued for
+    rendering separately, in chunks, once the import commits.
+
+    Returns ``(guests, errors)``.
+    """
+    context = {"region": region or getattr(settings, "PHONE_REGION", None)}
+    seen_emails = {
+        email.lower()
+        for email in invitation.guests.exclude(email=None).values_list("email", flat=True)
+    }
+
+    guests = []
+    errors = []
+    for row_number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": row_number, "field": None, "message": "Expected an object."})
+            continue
+        if isinstance(row.get(None), list):
+            # Extra cells past the CSV header
+            row = {key: value for key, value in row.items() if key is not None}
+        if not any(value not in (None, "") for value in row.values()):
+            continue
+
+        try:
+            cleaned = GuestRow.model_validate(
+                {_column(key): value for key, value in row.items()}, context=context
+            )
+        except RowValidationError as exc:
+            errors.extend(_row_errors(row_number, exc))
+            continue
+
+        if cleaned.email:
+            if cleaned.email.lower() in seen_emails:
+                errors.append({
+                    "row": row_number,
+                    "field": "email",
+                    "message": "A guest with this email already exists for this invitation.",
+                })
+                continue
+            seen_emails.add(cleaned.email.lower())
+
+        guests.append(Guest(invitation=invitation, **cleaned.model_dump()))
+
+    with transaction.atomic():
+        Guest.objects.bulk_create(guests, batch_size=IMPORT_BATCH_SIZE)
+        guest_ids = [str(guest.pk) for guest in guests]
+        planner_id = invitation.event.planner_id
+        transaction.on_commit(lambda: queue_card_renders(guest_ids, planner_id))
+    return guests, errors
+
+
+def queue_card_renders(guest_ids, planner_id):
+    """Hand new guests to the card render workers in chunks, in the bulk
+    lane. In lazy mode cards are rendered on first view instead."""
+    if card_render_mode() != "eager":
+        return
+    schedule_renders(
+        render_guest_card_batch,
+        guest_ids,
+        "bulk",
+        planner_id=planner_id,
+        chunk_size=RERENDER_CHUNK_SIZE,
+    )
@@ -0,0 +1,305 @@
+import logging
+import mimetypes
+import posixpath
+import smtplib
+import time
+from collections import namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Avg, Count, F, Q
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils.text import slugify
+from django.utils.timezone import now
+
+from utils.generators import get_invitee_name
+from utils.sms import SMSMessage, get_sms_provider, normalize_number
+from utils.sms import send_messages as send_sms_messages
+from .models import DeliveryLog, InvitationDispatch
+
+logger = logging.getLogger(__name__)
+
+INVITATION_EMAIL_TEMPLATE = "account/email/invitation_email.html"
+SITE_NAME = "Wedding Reservation System"
+
+# Errors of a single send; anything else is a bug
+SEND_ERRORS = (smtplib.SMTPException, OSError)
+
+
+def is_transient(exc):
+    """Whether a send error is worth retrying: connection trouble and 4xx
+    replies are, permanent 5xx refusals are not."""
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in exc.recipients.values())
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return True
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def read_card_attachment(guest):
+    """``(filename, content, mimetype)`` for the guest's stored card, read
+    through its storage (local or S3) as it was rendered, or None while the
+    card isn't ready."""
+    card = guest.card_image
+    if not card:
+        return None
+    with card.storage.open(card.name, "rb") as source:
+        content = b"".join(source.chunks())
+    filename = "invitation-{}{}".format(
+        slugify(get_invitee_name(guest) or "") or guest.id,
+        posixpath.splitext(card.name)[1],
+    )
+    mimetype = mimetypes.guess_type(card.name)[0] or "application/octet-stream"
+    return filename, content, mimetype
+
+
+def invitation_email(guest, event, template, connection=None):
+    """Build the invitation email for ``guest``, with the guest's card
+    attached when it has been rendered. ``template`` is loaded once by the
+    caller and rendered per guest."""
+    base_url = getattr(settings, "SITE_URL", "http://localhost:8000")
+    attachment = read_card_attachment(guest)
+    context = {
+        "guest": guest,
+        "invitee_name": get_invitee_name(guest),
+        "event": event,
+        "card_url": f"{base_url}{reverse('invitation_card', args=[str(guest.id)])}",
+        "card_attached": attachment is not None,
+        "site_name": SITE_NAME,
+    }
+    message = EmailMessage(
+        subject=f"Invitation to {event.title}",
+        body=template.render(context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[guest.email],
+        connection=connection,
+    )
+    message.content_subtype = "html"
+    if attachment is not None:
+        message.attach(*attachment)
+    return message
+
+
+SendResult = namedtuple("SendResult", ["message", "sent", "attempts", "latency_ms", "error"])
+
+
+def send_batch(connection, messages, max_retries=0, backoff=1.0, sleep=time.sleep):
+    """Send ``messages`` over the open ``connection``.
+
+    Messages go out one ``send_messages`` call each, so a refused recipient
+    only fails its own message. Transient failures are retried together,
+    up to ``max_retries`` times with exponential backoff, on a reopened
+    connection. Returns a ``SendResult`` per message, in order.
+    """
+    results = {}
+    pending = messages
+    for attempt in range(1, max_retries + 2):
+        if attempt > 1:
+            sleep(backoff * 2 ** (attempt - 2))
+            # The server may have dropped us; the next send reconnects
+            connection.close()
+
+        retry = []
+        for message in pending:
+            started = time.monotonic()
+            error = None
+            transient = True
+            try:
+                if not connection.send_messages([message]):
+                    error = "Not sent"
+            except SEND_ERRORS as exc:
+                error = str(exc) or exc.__class__.__name__
+                transient = is_transient(exc)
+            latency_ms = round((time.monotonic() - started) * 1000)
+            results[id(message)] = SendResult(message, error is None, attempt, latency_ms, error)
+            if error is not None and transient:
+                retry.append(message)
+        if not retry:
+            break
+        pending = retry
+    return [results[id(message)] for message in messages]
+
+
+def invitation_sms(guest, event):
+    """The text message inviting ``guest``, with a link to their card."""
+    base_url = getattr(settings, "SITE_URL", "http://localhost:8000")
+    parts = [f"Hi {get_invitee_name(guest) or 'there'}, you are invited to {event.title}"]
+    if event.date:
+        parts.append(f"on {event.date:%d %b %Y}")
+    if event.venue:
+        parts.append(f"at {event.venue}")
+    card_url = f"{base_url}{reverse('invitation_card', args=[str(guest.id)])}"
+    return f"{' '.join(parts)}. Your card: {card_url}"
+
+
+class DispatchExpired(Exception):
+    """The dispatch being sent was expired by ``expire_stale_dispatches``."""
+
+
+def _record_results(dispatch, batch, results, missing):
+    """Write a batch of delivery logs with one ``bulk_update`` and add it
+    to the dispatch's counts. ``results`` maps log ids to the send results
+    of the logs that were sent; the others failed with ``missing``.
+    Raises ``DispatchExpired`` if the dispatch is no longer sending."""
+    finished = now()
+    for log in batch:
+        result = results.get(log.pk)
+        if result is None:
+            log.status = "failed"
+            log.error = missing
+        else:
+            log.status = "sent" if result.sent else "failed"
+            log.attempts += result.attempts
+            log.latency_ms = result.latency_ms
+            log.error = result.error or ""
+            if not result.sent:
+                logger.warning(
+                    "Invitation %s to guest %s not sent: %s", log.channel, log.guest_id, result.error
+                )
+        log.updated_at = finished
+    DeliveryLog.objects.bulk_update(
+        batch, ["status", "attempts", "latency_ms", "error", "updated_at"]
+    )
+
+    sent = sum(log.status == "sent" for log in batch)
+    if not InvitationDispatch.objects.filter(pk=dispatch.pk, status="sending").update(
+        sent=F("sent") + sent, failed=F("failed") + len(batch) - sent, updated_at=finished
+    ):
+        # Expired as stale while we were sending; its guests may be retried
+        raise DispatchExpired(dispatch.pk)
+
+
+def _pending_logs(dispatch, channel, batch_size):
+    return (
+        dispatch.deliveries.filter(status="pending", channel=channel)
+        .select_related("guest")
+        .order_by("id")
+        .iterator(chunk_size=batch_size)
+    )
+
+
+def _deliver_email(dispatch, event, sleep):
+    batch_size = getattr(settings, "INVITATION_EMAIL_BATCH_SIZE", 50)
+    rate = getattr(settings, "INVITATION_EMAIL_RATE", 10)
+    max_retries = getattr(settings, "INVITATION_EMAIL_MAX_RETRIES", 3)
+    template = get_template(INVITATION_EMAIL_TEMPLATE)
+
+    with get_connection() as connection:
+        for batch in _batches(_pending_logs(dispatch, "email", batch_size), batch_size):
+            started = time.monotonic()
+            sendable = [log for log in batch if log.guest.email]
+            messages = [
+                invitation_email(log.guest, event, template, connection) for log in sendable
+            ]
+            results = dict(zip(
+                (log.pk for log in sendable),
+                send_batch(connection, messages, max_retries, sleep=sleep),
+            ))
+            _record_results(dispatch, batch, results, "No email address")
+
+            if rate:
+                remaining = len(batch) / rate - (time.monotonic() - started)
+                if remaining > 0:
+                    sleep(remaining)
+
+
+def _deliver_sms(dispatch, event, sleep):
+    provider = get_sms_provider()
+    max_retries = getattr(settings, "SMS_MAX_RETRIES", 3)
+    region = getattr(settings, "PHONE_REGION", None)
+
+    # Paced by the provider's own rate limit
+    for batch in _batches(_pending_logs(dispatch, "sms", provider.batch_size), provider.batch_size):
+        sendable = []
+        for log in batch:
+            number = normalize_number(log.guest.phone, region) if log.guest.phone else None
+            if number:
+                sendable.append((log, SMSMessage(number, invitation_sms(log.guest, event))))
+        results = dict(zip(
+            (log.pk for log, _ in sendable),
+            send_sms_messages(
+                provider, [message for _, message in sendable], max_retries, sleep=sleep
+            ),
+        ))
+        _record_results(dispatch, batch, results, "No valid phone number")
+
+
+def deliver_invitations(dispatch, sleep=time.sleep):
+    """Send the pending invitations of ``dispatch``, emails first, then
+    text messages.
+
+    All email batches share one SMTP connection and are paced to
+    ``INVITATION_EMAIL_RATE`` messages per second (0 for no limit); text
+    messages go through the default SMS provider at its own rate. After
+    each batch its delivery logs are written with one ``bulk_update`` and
+    the dispatch's counts are updated. Returns the updated dispatch, or
+    None if it was no longer queued.
+    """
+    event = dispatch.invitation.event
+
+    # Claim the job, so a duplicate task can't send it twice
+    if not InvitationDispatch.objects.filter(pk=dispatch.pk, status="queued").update(
+        status="sending", updated_at=now()
+    ):
+        return None
+    try:
+        channels = set(
+            dispatch.deliveries.filter(status="pending").values_list("channel", flat=True).distinct()
+        )
+        if "email" in channels:
+            _deliver_email(dispatch, event, sleep)
+        if "sms" in channels:
+            _deliver_sms(dispatch, event, sleep)
+    except DispatchExpired:
+        logger.warning("Dispatch %s expired while sending; stopped", dispatch.pk)
+        dispatch.refresh_from_db()
+        return dispatch
+    except Exception:
+        InvitationDispatch.objects.filter(pk=dispatch.pk).update(
+            status="failed", finished_at=now()
+        )
+        raise
+
+    InvitationDispatch.objects.filter(pk=dispatch.pk, status="sending").update(
+        status="done", finished_at=now()
+    )
+    dispatch.refresh_from_db()
+    return dispatch
+
+
+def expire_stale_dispatches(dispatches):
+    """Mark those of ``dispatches`` still queued or sending that haven't
+    advanced for ``INVITATION_DISPATCH_STALE_AFTER`` seconds, e.g. because
+    their worker died, as failed. Their pending deliveries can then be
+    retried. Returns the number expired."""
+    return dispatches.filter(
+        status__in=["queued", "sending"], updated_at__lt=InvitationDispatch.stale_before()
+    ).update(status="failed", finished_at=now())
+
+
+def delivery_summary(planner, channel=None):
+    """Sent, failed and pending deliveries per event of ``planner``, with
+    the average send latency, from one aggregate query. Returns a dict
+    keyed by event id."""
+    logs = DeliveryLog.objects.filter(guest__invitation__event__planner=planner)
+    if channel:
+        logs = logs.filter(channel=channel)
+    rows = (
+        logs.values("guest__invitation__event")
+        .annotate(
+            sent=Count("id", filter=Q(status="sent")),
+            failed=Count("id", filter=Q(status="failed")),
+            pending=Count("id", filter=Q(status="pending")),
+            avg_latency_ms=Avg("latency_ms", filter=Q(status="sent")),
+        )
+        .order_by()
+    )
+    return {row.pop("guest__invitation__event"): row for row in rows}
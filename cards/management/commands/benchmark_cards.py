@@ -0,0 +1,241 @@
+import json
+import resource
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from utils.generators import (
+    CARD_FORMATS,
+    DEFAULT_THEME,
+    RASTER_BACKENDS,
+    CardRenderBatch,
+    StageTimer,
+    available_cpus,
+    card_qr_image,
+    encode_card,
+    encoder_stats,
+    render_card_background,
+    render_wedding_card,
+    wrap_card_file,
+)
+
+STAGES = ["background", "text_layout", "qr_build", "qr_resize", "encode", "wrap", "total"]
+
+# Cards encoded in every format for the size vs. CPU comparison
+ENCODER_SAMPLE = 20
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def synthetic_event(schedules):
+    start = datetime(2026, 12, 5, 14, 30, tzinfo=timezone.utc)
+    event = SimpleNamespace(
+        id="00000000-0000-0000-0000-000000000000",
+        title="Wedding of Chanda & Mwila",
+        couple="Chanda & Mwila",
+        date=start,
+        venue="Mulungushi International Conference Centre",
+    )
+    events = [
+        {
+            "name": name,
+            "date": (start + timedelta(hours=hour)).strftime("%A, %B %d, %Y"),
+            "time": (start + timedelta(hours=hour)).strftime("%I:%M %p"),
+            "location": location,
+        }
+        for name, hour, location in [
+            ("Ceremony", 0, "Cathedral of the Holy Cross"),
+            ("Reception", 4, "Mulungushi International Conference Centre"),
+            ("After Party", 9, "Taj Pamodzi Hotel"),
+        ][:schedules]
+    ]
+    return event, events if len(events) > 1 else None
+
+
+def synthetic_guests(count):
+    return [
+        (
+            f"00000000-0000-0000-0000-{index:012d}",
+            f"Guest Number {index}",
+            (index % 4) * 250 or None,
+            f"https://cards.example.com/verify/00000000-0000-0000-0000-{index:012d}/",
+        )
+        for index in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Benchmark card rendering with synthetic fixtures (no database needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, default=200, help="Cards per run.")
+        parser.add_argument(
+            "--max-workers",
+            type=int,
+            default=available_cpus(),
+            help="Highest process count for the throughput runs.",
+        )
+        parser.add_argument("--schedules", type=int, default=2, choices=[1, 2, 3])
+        parser.add_argument("--format", default="png", choices=sorted(CARD_FORMATS))
+        parser.add_argument("--raster", default=None, choices=RASTER_BACKENDS)
+        parser.add_argument("--output", help="Write the results as JSON to this path.")
+
+    def handle(self, *args, **options):
+        event, events = synthetic_event(options["schedules"])
+        guests = synthetic_guests(options["cards"])
+
+        # Measure rendering itself, not the render cache
+        with override_settings(CARD_CACHE={}):
+            results = {
+                "cards": options["cards"],
+                "format": options["format"],
+                "raster": options["raster"],
+                "background_build_ms": self.bench_background(),
+                "stages": self.bench_stages(event, events, guests, options),
+                "encoders": self.bench_encoders(event, events, guests, options),
+                "throughput": self.bench_throughput(event, events, guests, options),
+            }
+
+        self.report(results)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def bench_background(self):
+        timings = {}
+        for raster in RASTER_BACKENDS:
+            started = time.perf_counter()
+            render_card_background(theme=DEFAULT_THEME, raster=raster)
+            timings[raster] = round((time.perf_counter() - started) * 1000, 3)
+        return timings
+
+    def render_card(self, event, events, guest, options, timings=None):
+        _, invitee_name, payment_amount, qr_payload = guest
+        timer = StageTimer(timings)
+        qr_image = card_qr_image(qr_payload)
+        timer.lap("qr_build")
+
+        image = render_wedding_card(
+            event,
+            qr_image=qr_image,
+            invitee_name=invitee_name,
+            events=events,
+            payment_amount=payment_amount,
+            raster=options["raster"],
+            timings=timings,
+        )
+        return wrap_card_file(image, event, options["format"], timings=timings)
+
+    def bench_stages(self, event, events, guests, options):
+        samples = {stage: [] for stage in STAGES}
+        for guest in guests:
+            timings = {}
+            started = time.perf_counter()
+            self.render_card(event, events, guest, options, timings)
+            timings["total"] = time.perf_counter() - started
+            for stage in STAGES:
+                samples[stage].append(timings.get(stage, 0.0) * 1000)
+
+        stages = {
+            stage: {
+                "p50_ms": round(percentile(values, 0.5), 3),
+                "p95_ms": round(percentile(values, 0.95), 3),
+            }
+            for stage, values in samples.items()
+        }
+
+        # Separate pass, as tracing allocations would skew the timings above
+        tracemalloc.start()
+        for guest in guests:
+            self.render_card(event, events, guest, options)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stages["memory"] = {
+            "tracemalloc_peak_mb": round(peak / 1024 / 1024, 2),
+            # ru_maxrss is reported in kilobytes on Linux
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        }
+        return stages
+
+    def bench_encoders(self, event, events, guests, options):
+        """Encode the same sample of cards in every format, for the bytes
+        stored and sent against the CPU spent encoding."""
+        images = []
+        for _, invitee_name, payment_amount, qr_payload in guests[:ENCODER_SAMPLE]:
+            images.append(render_wedding_card(
+                event,
+                qr_image=card_qr_image(qr_payload),
+                invitee_name=invitee_name,
+                events=events,
+                payment_amount=payment_amount,
+                raster=options["raster"],
+            ))
+
+        encoder_stats(reset=True)
+        for card_format in CARD_FORMATS:
+            for image in images:
+                encode_card(image, card_format)
+        return {
+            card_format: {
+                "avg_bytes": round(stats["avg_bytes"]),
+                "avg_ms": round(stats["avg_ms"], 3),
+            }
+            for card_format, stats in encoder_stats(reset=True).items()
+        }
+
+    def bench_throughput(self, event, events, guests, options):
+        worker_counts = []
+        workers = 1
+        while workers < options["max_workers"]:
+            worker_counts.append(workers)
+            workers *= 2
+        worker_counts.append(options["max_workers"])
+
+        throughput = {}
+        for workers in worker_counts:
+            batch = CardRenderBatch(
+                event,
+                events,
+                guests,
+                max_workers=workers,
+                raster=options["raster"],
+                card_format=options["format"],
+            )
+            for _ in batch:
+                pass
+            throughput[str(workers)] = round(batch.throughput, 2)
+        return throughput
+
+    def report(self, results):
+        self.stdout.write(
+            f"{results['cards']} cards, format={results['format']}, "
+            f"raster={results['raster'] or 'default'}"
+        )
+        self.stdout.write(f"Background build (ms): {results['background_build_ms']}")
+        self.stdout.write(f"{'stage':<14}{'p50 ms':>10}{'p95 ms':>10}")
+        for stage in STAGES:
+            timing = results["stages"][stage]
+            self.stdout.write(f"{stage:<14}{timing['p50_ms']:>10.2f}{timing['p95_ms']:>10.2f}")
+        memory = results["stages"]["memory"]
+        self.stdout.write(
+            f"Peak traced memory: {memory['tracemalloc_peak_mb']} MB, "
+            f"max RSS: {memory['max_rss_mb']} MB"
+        )
+        self.stdout.write(f"{'format':<16}{'avg KB':>10}{'avg ms':>10}")
+        for card_format, stats in results["encoders"].items():
+            marker = " *" if card_format == results["format"] else ""
+            self.stdout.write(
+                f"{card_format:<16}{stats['avg_bytes'] / 1024:>10.1f}{stats['avg_ms']:>10.2f}{marker}"
+            )
+        for workers, cards_per_sec in results["throughput"].items():
+            self.stdout.write(f"{workers} worker(s): {cards_per_sec} cards/sec")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0004_guest_payment_amount_eventschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weddingevent',
+            name='card_format',
+            field=models.CharField(blank=True, choices=[('png', 'PNG (optimized)'), ('png-fast', 'PNG (fast)'), ('png-quantized', 'PNG (palette)'), ('webp', 'WebP'), ('jpeg', 'JPEG (progressive)')], default='', help_text='Image format for guest cards. Leave blank for the site default.', max_length=20),
+        ),
+    ]
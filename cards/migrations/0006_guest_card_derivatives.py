@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0005_weddingevent_card_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guest',
+            name='card_preview',
+            field=models.ImageField(blank=True, null=True, upload_to='guest_cards/previews/'),
+        ),
+        migrations.AddField(
+            model_name='guest',
+            name='card_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='guest_cards/thumbnails/'),
+        ),
+    ]
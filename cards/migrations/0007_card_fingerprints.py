@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0006_guest_card_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guest',
+            name='card_event_fingerprint',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='guest',
+            name='card_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='weddingevent',
+            name='card_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:20
+
+from django.db import migrations, models
+
+
+def mark_rendered_cards_ready(apps, schema_editor):
+    Guest = apps.get_model("cards", "Guest")
+    Guest.objects.exclude(card_image="").exclude(card_image__isnull=True).update(
+        render_status="ready"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0007_card_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guest',
+            name='render_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('rendering', 'Rendering'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', editable=False, max_length=10),
+        ),
+        migrations.RunPython(mark_rendered_cards_ready, migrations.RunPython.noop),
+    ]
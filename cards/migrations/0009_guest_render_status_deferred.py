@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0008_guest_render_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='guest',
+            name='render_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('deferred', 'Deferred'), ('rendering', 'Rendering'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', editable=False, max_length=10),
+        ),
+    ]
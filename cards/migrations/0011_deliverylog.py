@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:31
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0010_invitationdispatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryLog',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('channel', models.CharField(choices=[('email', 'Email'), ('sms', 'SMS')], default='email', max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('dispatch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='cards.invitationdispatch')),
+                ('guest', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deliveries', to='cards.guest')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dispatch', 'status'], name='cards_deliv_dispatc_55ae6b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0011_deliverylog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invitationdispatch',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from utils.generators import event_fingerprint, get_event_schedules
+
+
+def backfill_card_fingerprints(apps, schema_editor):
+    """Record the fingerprint of every event that predates 0007, and stamp
+    its already-rendered cards with it, so the event's next save only
+    re-renders them if a field on the cards actually changed."""
+    WeddingEvent = apps.get_model("cards", "WeddingEvent")
+    Guest = apps.get_model("cards", "Guest")
+    events = WeddingEvent.objects.filter(card_fingerprint="").prefetch_related("event_schedules")
+    for event in events.iterator(chunk_size=200):
+        fingerprint = event_fingerprint(
+            event, get_event_schedules(event), card_format=event.card_format
+        )
+        WeddingEvent.objects.filter(pk=event.pk).update(card_fingerprint=fingerprint)
+        Guest.objects.filter(invitation__event=event, card_event_fingerprint="").exclude(
+            card_image=""
+        ).exclude(card_image__isnull=True).update(card_event_fingerprint=fingerprint)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0012_invitationdispatch_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_card_fingerprints, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -5,11 +8,14 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.urls import reverse
+from django.utils import timezone
 from django_extensions.db.fields import AutoSlugField
 import uuid
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
+from utils.generators import CARD_DERIVATIVES, CARD_FORMATS, CARD_SIZE
+
 
 class CustomUserManager(BaseUserManager):
     def _create_user(self, email, phone, password, **extra_fields):
@@ -133,6 +139,16 @@ class WeddingEvent(models.Model):
             ("completed", "Completed"),
         ],
     )
+    card_format = models.CharField(
+        max_length=20,
+        blank=True,
+        default="",
+        choices=[(name, encoder["label"]) for name, encoder in CARD_FORMATS.items()],
+        help_text="Image format for guest cards. Leave blank for the site default.",
+    )
+    # Fingerprint of the rendered fields when guest cards were last queued
+    # for re-rendering; see cards.rendering.event_card_fingerprint
+    card_fingerprint = models.CharField(max_length=64, blank=True, editable=False)
 
     class Meta:
         ordering = ["-date"]
@@ -195,11 +211,45 @@ class Guest(models.Model):
     )
 
     card_image = models.ImageField(upload_to="guest_cards/", blank=True, null=True)
+    card_thumbnail = models.ImageField(
+        upload_to="guest_cards/thumbnails/", blank=True, null=True
+    )
+    card_preview = models.ImageField(
+        upload_to="guest_cards/previews/", blank=True, null=True
+    )
     qr_code = models.ImageField(upload_to="qr_codes/", blank=True)
+    # Render inputs the stored card was built from: all of them, and the
+    # event-level subset used to find stale cards when an event changes
+    card_fingerprint = models.CharField(max_length=64, blank=True, editable=False)
+    card_event_fingerprint = models.CharField(
+        max_length=64, blank=True, editable=False, db_index=True
+    )
+    render_status = models.CharField(
+        max_length=10,
+        default="pending",
+        editable=False,
+        choices=[
+            ("pending", "Pending"),
+            ("deferred", "Deferred"),
+            ("rendering", "Rendering"),
+            ("ready", "Ready"),
+            ("failed", "Failed"),
+        ],
+    )
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    @property
+    def card_srcset(self):
+        """``srcset`` value listing every stored size of the card."""
+        sources = [
+            (self.card_thumbnail, CARD_DERIVATIVES["thumbnail"][0]),
+            (self.card_preview, CARD_DERIVATIVES["preview"][0]),
+            (self.card_image, CARD_SIZE[0]),
+        ]
+        return ", ".join(f"{image.url} {width}w" for image, width in sources if image)
+
 
 class QRVerification(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -221,3 +271,87 @@ class QRVerification(models.Model):
 
     def __str__(self):
         return f"Verification for {self.guest} at {self.scanned_at}"
+
+
+class InvitationDispatch(models.Model):
+    """A background send of an invitation's emails, polled for progress."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    invitation = models.ForeignKey(
+        Invitation, on_delete=models.CASCADE, related_name="dispatches"
+    )
+    status = models.CharField(
+        max_length=10,
+        default="queued",
+        choices=[
+            ("queued", "Queued"),
+            ("sending", "Sending"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+        ],
+    )
+    total = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set by the sender after every batch; an active dispatch that stops
+    # advancing (e.g. its worker died) goes stale
+    updated_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Dispatch {self.id} for {self.invitation}"
+
+    @classmethod
+    def stale_before(cls):
+        """Active dispatches last updated before this are stale."""
+        return timezone.now() - timedelta(
+            seconds=getattr(settings, "INVITATION_DISPATCH_STALE_AFTER", 15 * 60)
+        )
+
+    @property
+    def is_active(self):
+        return self.status in ("queued", "sending") and self.updated_at >= self.stale_before()
+
+    @property
+    def progress(self):
+        """Share of the emails handled so far, in percent."""
+        if not self.total:
+            return 100
+        return round((self.sent + self.failed) * 100 / self.total)
+
+
+class DeliveryLog(models.Model):
+    """Outcome of sending one guest their invitation over one channel."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    guest = models.ForeignKey(Guest, on_delete=models.CASCADE, related_name="deliveries")
+    dispatch = models.ForeignKey(
+        InvitationDispatch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="deliveries",
+    )
+    channel = models.CharField(
+        max_length=10,
+        default="email",
+        choices=[("email", "Email"), ("sms", "SMS")],
+    )
+    status = models.CharField(
+        max_length=10,
+        default="pending",
+        choices=[("pending", "Pending"), ("sent", "Sent"), ("failed", "Failed")],
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set explicitly, as the dispatcher writes logs with bulk_update
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["dispatch", "status"])]
+
+    def __str__(self):
+        return f"{self.get_channel_display()} to {self.guest}: {self.status}"
@@ -0,0 +1,280 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from utils.generators import (
+    BASE_DPI,
+    CARD_DERIVATIVES,
+    available_cpus,
+    build_qr_matrix,
+    can_start_render_pool,
+    card_fingerprint,
+    card_qr_image,
+    discard_render_pool,
+    event_fingerprint,
+    generate_card_files,
+    get_event_schedules,
+    get_invitee_name,
+    get_render_pool,
+    get_verify_url,
+    qr_bitmap,
+    qr_png,
+    render_card_tiles,
+    render_event_cards,
+)
+from .models import Guest
+
+logger = logging.getLogger(__name__)
+
+# Striped locks that coalesce concurrent renders of the same guest within a
+# process; the row lock in ensure_guest_card covers other processes.
+_render_locks = [threading.Lock() for _ in range(64)]
+
+# Set once the "no process pool in a daemonic worker" warning is logged
+_pool_unavailable_warned = threading.Event()
+
+# Everything render_guest_card writes. It saves only these, so storing a
+# card is a single narrow UPDATE that doesn't touch fields (e.g. check-in)
+# another request may have changed meanwhile.
+CARD_RENDER_FIELDS = (
+    "qr_code",
+    "card_image",
+    "card_thumbnail",
+    "card_preview",
+    "card_fingerprint",
+    "card_event_fingerprint",
+    "render_status",
+)
+
+
+def card_render_mode():
+    """"eager" renders cards when guests are created, "lazy" on first view."""
+    return getattr(settings, "CARD_RENDER_MODE", "eager")
+
+
+def event_card_fingerprint(event, events=None):
+    if events is None:
+        events = get_event_schedules(event)
+    return event_fingerprint(event, events, card_format=event.card_format)
+
+
+def guest_card_fingerprint(guest, events=None):
+    event = guest.invitation.event
+    if events is None:
+        events = get_event_schedules(event)
+    return card_fingerprint(
+        event,
+        events=events,
+        invitee_name=get_invitee_name(guest),
+        payment_amount=guest.payment_amount,
+        qr_payload=get_verify_url(guest),
+        card_format=event.card_format,
+    )
+
+
+def guest_card_etag(guest):
+    """Strong ETag for a guest's card.
+
+    A stored card is tagged with the fingerprint it was rendered from, so
+    a stale card waiting for its re-render keeps its old tag and the new
+    card gets a new one. A card still to be rendered on demand is tagged
+    with its current render inputs.
+    """
+    if guest.card_image:
+        if guest.card_fingerprint:
+            return f'"{guest.card_fingerprint}"'
+        # Rendered before fingerprints were stored
+        return f'"{hashlib.sha256(guest.card_image.name.encode()).hexdigest()[:32]}"'
+    return f'"{guest_card_fingerprint(guest)}"'
+
+
+CARD_FILE_FIELDS = ("qr_code", "card_image") + tuple(
+    f"card_{name}" for name in CARD_DERIVATIVES
+)
+
+
+def _delete_files(files):
+    for storage, name in files:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.warning("Could not delete replaced card file %s", name, exc_info=True)
+
+
+def store_guest_card(guest, qr_file, card_file, derivatives, events):
+    """Save a freshly rendered card, its smaller sizes and QR code on
+    ``guest`` with one narrow UPDATE.
+
+    Storage never overwrites, so each save gets a new file name; the files
+    they replace are deleted once the update is committed.
+    """
+    replaced = {
+        field: (getattr(guest, field).storage, getattr(guest, field).name)
+        for field in CARD_FILE_FIELDS
+        if getattr(guest, field)
+    }
+    guest.qr_code.save(qr_file.name, qr_file, save=False)
+    guest.card_image.save(card_file.name, card_file, save=False)
+    for name, derivative_file in derivatives.items():
+        getattr(guest, f"card_{name}").save(
+            derivative_file.name, derivative_file, save=False
+        )
+
+    event = guest.invitation.event
+    guest.card_fingerprint = guest_card_fingerprint(guest, events)
+    guest.card_event_fingerprint = event_card_fingerprint(event, events)
+    guest.render_status = "ready"
+    guest.save(update_fields=CARD_RENDER_FIELDS)
+
+    stale = [
+        (storage, name)
+        for field, (storage, name) in replaced.items()
+        if getattr(guest, field).name != name
+    ]
+    if stale:
+        transaction.on_commit(lambda: _delete_files(stale))
+    return guest
+
+
+def render_guest_card(guest, events=None):
+    """Generate the QR code and card for ``guest`` and save both.
+
+    ``events`` may be passed in when rendering several guests of the same
+    event, to avoid fetching the schedules for each of them.
+    """
+    verify_url = get_verify_url(guest)
+
+    # One QR matrix feeds both the card-sized bitmap and the stored PNG
+    qr_matrix = build_qr_matrix(verify_url)
+    qr_file = ContentFile(qr_png(qr_matrix), name=f"guest_qr_{guest.id}.png")
+
+    event = guest.invitation.event
+    if events is None:
+        events = get_event_schedules(event)
+
+    # Render once (or reuse the cached render), then store the full card
+    # and its smaller sizes
+    files = generate_card_files(
+        event,
+        qr_image=qr_bitmap(qr_matrix),
+        invitee_name=get_invitee_name(guest),
+        events=events,
+        payment_amount=guest.payment_amount,
+        card_format=event.card_format,
+        qr_payload=verify_url,
+    )
+    card_file = files.pop("card")
+    return store_guest_card(guest, qr_file, card_file, files, events)
+
+
+def card_render_workers():
+    """Processes to draw a batch of cards on: ``CARD_RENDER_WORKERS``, or
+    every available CPU when it is 0."""
+    workers = getattr(settings, "CARD_RENDER_WORKERS", 0)
+    return workers if workers > 0 else available_cpus()
+
+
+def render_guest_cards(event, guests, events=None):
+    """Render and store the cards of ``guests`` of ``event``.
+
+    With more than one worker (``card_render_workers``) the cards are drawn
+    on this process's shared render pool by ``render_event_cards`` and
+    stored here as they complete. Cards the pool didn't deliver, or that
+    failed to store, are then rendered one at a time, as are all of them in
+    a daemonic process (a Celery prefork child), which can't start a pool.
+    Returns the guests whose cards failed.
+    """
+    if events is None:
+        events = get_event_schedules(event)
+    remaining = {guest.pk: guest for guest in guests}
+
+    workers = card_render_workers()
+    if workers > 1 and len(remaining) > 1 and not can_start_render_pool():
+        if not _pool_unavailable_warned.is_set():
+            _pool_unavailable_warned.set()
+            logger.warning(
+                "Card renders can't use a process pool in a daemonic worker; "
+                "run the card_render worker with --pool=threads or --pool=solo"
+            )
+        workers = 1
+    if workers > 1 and len(remaining) > 1:
+        executor = get_render_pool(workers)
+        try:
+            for result in render_event_cards(
+                event, list(remaining.values()), workers, events=events, executor=executor
+            ):
+                store_guest_card(
+                    remaining[result.guest_id],
+                    result.qr_file,
+                    result.card_file,
+                    result.derivatives,
+                    events,
+                )
+                del remaining[result.guest_id]
+        except BrokenProcessPool:
+            discard_render_pool(executor)
+            logger.exception(
+                "Card render pool broke for event %s; rendering %d card(s) one at a time",
+                event.pk, len(remaining),
+            )
+        except Exception:
+            logger.exception(
+                "Parallel card render failed for event %s; rendering %d card(s) one at a time",
+                event.pk, len(remaining),
+            )
+
+    failed = []
+    for guest in remaining.values():
+        try:
+            render_guest_card(guest, events=events)
+        except Exception:
+            logger.exception("Card render failed for guest %s", guest.pk)
+            failed.append(guest)
+    return failed
+
+
+def iter_event_card_tiles(event, guests=None, dpi=None):
+    """Yield, for each guest of ``event``, their card drawn at ``dpi`` as
+    an iterator of ``(top, tile)`` bands (see ``render_card_tiles``), so
+    not even one whole card is held in memory (e.g. for print sheets).
+    Nothing is encoded or stored."""
+    if guests is None:
+        guests = Guest.objects.filter(invitation__event=event).order_by(
+            "first_name", "id"
+        ).iterator(chunk_size=200)
+    events = get_event_schedules(event)
+    dpi = dpi or BASE_DPI
+    for guest in guests:
+        yield render_card_tiles(
+            event,
+            qr_image=card_qr_image(get_verify_url(guest), dpi),
+            invitee_name=get_invitee_name(guest),
+            events=events,
+            payment_amount=guest.payment_amount,
+            dpi=dpi,
+        )
+
+
+def ensure_guest_card(guest):
+    """Return ``guest`` with a rendered card, rendering it if needed.
+
+    Concurrent first requests for the same guest wait on one render:
+    in-process callers share a lock and other processes block on the guest
+    row, then find the card already stored.
+    """
+    if guest.card_image:
+        return guest
+
+    with _render_locks[hash(guest.pk) % len(_render_locks)]:
+        with transaction.atomic():
+            locked = Guest.objects.select_for_update().get(pk=guest.pk)
+            if not locked.card_image:
+                render_guest_card(locked)
+
+    guest.refresh_from_db()
+    return guest
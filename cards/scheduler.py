@@ -0,0 +1,170 @@
+import logging
+import time
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.cache import caches
+from kombu.exceptions import OperationalError
+
+from .models import Guest
+
+logger = logging.getLogger(__name__)
+
+# Lanes and their Celery priorities; with the broker's priority ordering
+# (see CELERY_BROKER_TRANSPORT_OPTIONS) lower numbers are taken first
+RENDER_LANES = {
+    "interactive": 0,
+    "bulk": 5,
+    "rerender": 9,
+}
+# Lanes subject to admission control; interactive renders are always taken
+BACKGROUND_LANES = ("bulk", "rerender")
+
+# Counters expire so a crashed worker can't hold a planner's slots forever
+COUNTER_TTL = 60 * 60
+
+
+def _scheduler_cache():
+    return caches["render_scheduler"]
+
+
+def _incr(key, delta=1):
+    """Add ``delta`` to a counter, keeping it at 0 or above, and restart
+    its expiry so a counter in use doesn't expire under its holders."""
+    cache = _scheduler_cache()
+    cache.add(key, 0, COUNTER_TTL)
+    try:
+        value = cache.incr(key, delta)
+    except ValueError:
+        # Expired in between
+        cache.set(key, max(delta, 0), COUNTER_TTL)
+        return max(delta, 0)
+    if value < 0:
+        # Releases of work admitted before the counter last expired; add
+        # the deficit back rather than overwrite concurrent updates
+        value = cache.incr(key, -value)
+    cache.touch(key, COUNTER_TTL)
+    return value
+
+
+def lane_depth(lane):
+    """Cards queued or rendering in ``lane``."""
+    return _scheduler_cache().get(f"render:depth:{lane}", 0)
+
+
+def _admit(lane, count, planner_id):
+    """Take a planner slot and ``count`` places in the queue for a chunk,
+    or nothing if either limit would be exceeded."""
+    max_depth = getattr(settings, "RENDER_QUEUE_MAX_DEPTH", 2000)
+    planner_cap = getattr(settings, "RENDER_PLANNER_MAX_CHUNKS", 4)
+
+    if planner_id is not None:
+        if _incr(f"render:planner:{planner_id}") > planner_cap:
+            _incr(f"render:planner:{planner_id}", -1)
+            return False
+
+    depth = _incr(f"render:depth:{lane}", count)
+    others = sum(lane_depth(other) for other in BACKGROUND_LANES if other != lane)
+    if depth + others > max_depth:
+        _incr(f"render:depth:{lane}", -count)
+        if planner_id is not None:
+            _incr(f"render:planner:{planner_id}", -1)
+        return False
+    return True
+
+
+def _dispatch(task, args, lane, planner_id, count):
+    scheduled = {
+        "lane": lane,
+        "planner_id": planner_id,
+        "count": count,
+        "queued_at": time.time(),
+    }
+    try:
+        task.apply_async(args=args, kwargs={"scheduled": scheduled}, priority=RENDER_LANES[lane])
+    except OperationalError:
+        # Broker unreachable: render inline rather than leave cards pending
+        logger.exception("Could not queue %d card render(s) in the %s lane", count, lane)
+        task.apply(args=args, kwargs={"scheduled": scheduled})
+
+
+def schedule_renders(task, guest_ids, lane, planner_id=None, chunk_size=100):
+    """Queue card renders for ``guest_ids`` in ``lane``.
+
+    Interactive renders are queued one guest per ``task`` call, ahead of
+    everything else. Bulk and re-render work is queued in chunks of
+    ``chunk_size`` guests while the planner has fewer than
+    ``RENDER_PLANNER_MAX_CHUNKS`` chunks in flight and the background
+    lanes hold fewer than ``RENDER_QUEUE_MAX_DEPTH`` cards; the rest is
+    marked "deferred" and picked up later by ``dispatch_deferred_renders``.
+
+    Returns the ids that were deferred.
+    """
+    guest_ids = [str(guest_id) for guest_id in guest_ids]
+    if lane not in BACKGROUND_LANES:
+        for guest_id in guest_ids:
+            _incr(f"render:depth:{lane}")
+            _dispatch(task, [guest_id], lane, None, 1)
+        return []
+
+    deferred = []
+    for start in range(0, len(guest_ids), chunk_size):
+        chunk = guest_ids[start:start + chunk_size]
+        if deferred or not _admit(lane, len(chunk), planner_id):
+            deferred.extend(chunk)
+            continue
+        _dispatch(task, [chunk], lane, planner_id, len(chunk))
+
+    if deferred:
+        Guest.objects.filter(id__in=deferred).exclude(render_status="deferred").update(
+            render_status="deferred"
+        )
+        logger.info(
+            "Deferred %d card render(s) in the %s lane for planner %s",
+            len(deferred), lane, planner_id,
+        )
+    return deferred
+
+
+@task_prerun.connect
+def _record_wait(task=None, kwargs=None, **extra):
+    scheduled = (kwargs or {}).get("scheduled")
+    if not scheduled or task.request.retries:
+        return
+    lane = scheduled["lane"]
+    wait_ms = max(0, round((time.time() - scheduled["queued_at"]) * 1000))
+    _scheduler_cache().set(f"render:wait_last_ms:{lane}", wait_ms, COUNTER_TTL)
+    _incr(f"render:wait_total_ms:{lane}", wait_ms)
+    _incr(f"render:wait_count:{lane}")
+
+
+@task_postrun.connect
+def _release(kwargs=None, state=None, **extra):
+    scheduled = (kwargs or {}).get("scheduled")
+    if not scheduled or state == "RETRY":
+        return
+    _incr(f"render:depth:{scheduled['lane']}", -scheduled["count"])
+    if scheduled["planner_id"] is not None:
+        _incr(f"render:planner:{scheduled['planner_id']}", -1)
+
+
+def render_metrics():
+    """Queue depth and wait times per lane, plus deferred work."""
+    cache = _scheduler_cache()
+    lanes = {}
+    for lane, priority in RENDER_LANES.items():
+        waits = cache.get(f"render:wait_count:{lane}", 0)
+        lanes[lane] = {
+            "priority": priority,
+            "depth": max(0, lane_depth(lane)),
+            "wait_last_ms": cache.get(f"render:wait_last_ms:{lane}"),
+            "wait_avg_ms": (
+                round(cache.get(f"render:wait_total_ms:{lane}", 0) / waits) if waits else None
+            ),
+        }
+    return {
+        "lanes": lanes,
+        "deferred": Guest.objects.filter(render_status="deferred").count(),
+        "max_depth": getattr(settings, "RENDER_QUEUE_MAX_DEPTH", 2000),
+        "planner_max_chunks": getattr(settings, "RENDER_PLANNER_MAX_CHUNKS", 4),
+    }
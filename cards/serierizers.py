@@ -76,22 +76,28 @@ class WeddingEventSerializer(serializers.ModelSerializer):
         model = WeddingEvent
         fields = [
             'id', 'planner', 'title', 'couple', 'date', 'venue', 
-            'description', 'status', 'event_schedules'
+            'description', 'status', 'card_format', 'event_schedules'
         ]
         read_only_fields = ['id']
 
 
 class GuestSerializer(serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
+    card_srcset = serializers.CharField(read_only=True)
     
     class Meta:
         model = Guest
         fields = [
             'id', 'guest_name', 'first_name', 'last_name', 'full_name',
             'email', 'phone', 'is_attending', 'checked_in', 'check_in_time',
-            'payment_amount', 'card_image', 'qr_code'
+            'payment_amount', 'card_image', 'card_thumbnail', 'card_preview',
+            'card_srcset', 'qr_code', 'render_status'
+        ]
+        read_only_fields = [
+            'id', 'card_image', 'card_thumbnail', 'card_preview', 'qr_code',
+            'render_status',
+            'checked_in', 'check_in_time'
         ]
-        read_only_fields = ['id', 'card_image', 'qr_code', 'checked_in', 'check_in_time']
     
     def get_full_name(self, obj):
         if obj.guest_name:
@@ -138,7 +144,7 @@ class WeddingEventCreateSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = WeddingEvent
-        fields = ['title', 'couple', 'date', 'venue', 'description', 'status', 'event_schedules']
+        fields = ['title', 'couple', 'date', 'venue', 'description', 'status', 'card_format', 'event_schedules']
     
     def create(self, validated_data):
         event_schedules_data = validated_data.pop('event_schedules', [])
@@ -1,14 +1,12 @@
-from django.conf import settings
-from django.db.models.signals import post_save
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.urls import reverse
-import qrcode
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
 
-from utils.generators import generate_wedding_card
 from .models import Guest, Invitation, User, WeddingEvent, WeddingPlanner, EventSchedule
+from .rendering import CARD_RENDER_FIELDS, card_render_mode, event_card_fingerprint
+from .scheduler import schedule_renders
+from .tasks import render_guest_card_task, rerender_stale_cards
 
 
 @receiver(post_save, sender=User)
@@ -32,61 +30,53 @@ def create_invitation_for_event(sender, instance, created, **kwargs):
         )
 
 
-@receiver(post_save, sender=Guest)
-def generate_qr_and_card(sender, instance, created, **kwargs):
+def queue_stale_card_renders(event):
+    """Re-render existing guest cards in the background when a field they
+    show has changed; saves that only touch other fields are ignored."""
+    fingerprint = event_card_fingerprint(event)
+    if fingerprint == event.card_fingerprint:
+        return
+    WeddingEvent.objects.filter(pk=event.pk).update(card_fingerprint=fingerprint)
+    event.card_fingerprint = fingerprint
+    transaction.on_commit(lambda: rerender_stale_cards.delay(str(event.pk)))
+
+
+@receiver(post_save, sender=WeddingEvent)
+def rerender_cards_for_event(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
     if created:
-        base_url = getattr(settings, "SITE_URL", "http://localhost:8000")
-        verify_url = f"{base_url}{reverse('verify_invitation', args=[str(instance.id)])}"
-
-        qr_img = qrcode.make(verify_url)
-        qr_buffer = BytesIO()
-        qr_img.save(qr_buffer, format="PNG")
-        qr_image = Image.open(qr_buffer)
-
-        qr_io = BytesIO()
-        qr_img.save(qr_io, format="PNG")
-        qr_file_name = f"guest_qr_{instance.id}.png"
-        instance.qr_code.save(qr_file_name, ContentFile(qr_io.getvalue()), save=False)
-
-        # Prepare invitee name from guest information
-        invitee_name = None
-        if instance.guest_name:
-            invitee_name = instance.guest_name
-        elif instance.first_name and instance.last_name:
-            invitee_name = f"{instance.first_name} {instance.last_name}"
-        elif instance.first_name:
-            invitee_name = instance.first_name
-        
-        # Get multiple events if available
-        event_schedules = instance.invitation.event.event_schedules.all()
-        events_data = []
-        
-        if event_schedules.exists():
-            # Convert EventSchedule objects to dictionaries for the generator
-            for schedule in event_schedules:
-                events_data.append({
-                    'name': schedule.event_name,
-                    'date': schedule.date.strftime("%A, %B %d, %Y"),
-                    'time': schedule.date.strftime("%I:%M %p"),
-                    'location': schedule.location,
-                    'description': schedule.description or ''
-                })
-        
-        # Use multiple events if available, otherwise None for single event
-        events = events_data if len(events_data) > 1 else None
-        
-        # Get payment amount from guest
-        payment_amount = instance.payment_amount
-        
-        # Generate card with new features
-        card_file = generate_wedding_card(
-            event=instance.invitation.event, 
-            invitation=instance.invitation, 
-            qr_image=qr_image,
-            invitee_name=invitee_name,
-            events=events,
-            payment_amount=payment_amount
+        # No guests yet; just record what their cards will be built from
+        instance.card_fingerprint = event_card_fingerprint(instance)
+        WeddingEvent.objects.filter(pk=instance.pk).update(
+            card_fingerprint=instance.card_fingerprint
         )
-        instance.card_image.save(card_file.name, card_file, save=False)
+        return
+    queue_stale_card_renders(instance)
+
+
+@receiver(post_save, sender=EventSchedule)
+@receiver(post_delete, sender=EventSchedule)
+def rerender_cards_for_schedule(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    event = WeddingEvent.objects.filter(pk=instance.wedding_event_id).first()
+    if event is not None:
+        queue_stale_card_renders(event)
+
+
+@receiver(post_save, sender=Guest)
+def generate_qr_and_card(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Storing a rendered card saves the guest again; never react to that
+    if raw or (update_fields and set(update_fields) <= set(CARD_RENDER_FIELDS)):
+        return
+    # Rendered by a worker once the guest is committed, so creating a guest
+    # doesn't wait on it. In lazy mode the card is rendered on first view.
+    if created and card_render_mode() == "eager":
+        guest_id = str(instance.pk)
+        transaction.on_commit(lambda: queue_card_render(guest_id))
+
 
-        instance.save()
+def queue_card_render(guest_id):
+    # A planner is waiting on this one; it goes ahead of bulk work
+    schedule_renders(render_guest_card_task, [guest_id], "interactive")
@@ -0,0 +1,224 @@
+import logging
+import os
+import tempfile
+
+from celery import shared_task
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import slugify
+from django.utils.timezone import now
+
+from utils.generators import get_event_schedules
+from utils.printing import PRINT_DPI, print_card_dpi, write_print_pdf
+from utils.sms import SMSMessage, get_sms_provider, send_messages
+from .mailing import deliver_invitations
+from .models import Guest, InvitationDispatch, WeddingEvent
+from .rendering import (
+    event_card_fingerprint,
+    guest_card_fingerprint,
+    iter_event_card_tiles,
+    render_guest_card,
+    render_guest_cards,
+)
+from .scheduler import RENDER_LANES, schedule_renders
+
+logger = logging.getLogger(__name__)
+
+RERENDER_CHUNK_SIZE = 100
+RENDER_MAX_RETRIES = 3
+SMS_MAX_RETRIES = getattr(settings, "SMS_MAX_RETRIES", 3)
+
+
+@shared_task(bind=True, acks_late=True, max_retries=RENDER_MAX_RETRIES)
+def render_guest_card_task(self, guest_id, scheduled=None):
+    """Render a new guest's card off the request path.
+
+    Safe to run more than once: a card already built from the guest's
+    current inputs is left as it is. Failures are retried with backoff,
+    after which the guest is marked "failed". ``scheduled`` is set by
+    ``cards.scheduler`` for its bookkeeping.
+    """
+    guest = Guest.objects.select_related("invitation__event").filter(id=guest_id).first()
+    if guest is None:
+        return None
+    events = get_event_schedules(guest.invitation.event)
+
+    # Left "pending" while rendering, so the guest row is written only
+    # once, when the card is stored
+    try:
+        with transaction.atomic():
+            # Wait out a concurrent render of the same guest, then re-check
+            locked = (
+                Guest.objects.select_for_update()
+                .select_related("invitation__event")
+                .get(pk=guest.pk)
+            )
+            if locked.card_image and locked.card_fingerprint == guest_card_fingerprint(locked, events):
+                if locked.render_status != "ready":
+                    Guest.objects.filter(pk=locked.pk).update(render_status="ready")
+                return locked.card_fingerprint
+            render_guest_card(locked, events=events)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            Guest.objects.filter(pk=guest.pk).update(render_status="failed")
+            logger.exception("Giving up on card render for guest %s", guest_id)
+            raise
+        raise self.retry(exc=exc, countdown=10 * 2 ** self.request.retries)
+    return locked.card_fingerprint
+
+
+@shared_task
+def render_guest_card_batch(guest_ids, scheduled=None):
+    """Render the cards of a chunk of guests, e.g. from a bulk import or
+    after an event change, skipping cards that are already up to date.
+
+    Schedules are looked up once per event, and each event's cards are
+    drawn in parallel by ``render_guest_cards``. A guest whose card fails
+    is marked "failed" (and can be re-rendered alone) without stopping the
+    rest of the chunk. Returns the number of cards rendered.
+    """
+    Guest.objects.filter(id__in=guest_ids, render_status__in=["pending", "deferred"]).update(
+        render_status="rendering"
+    )
+    guests = Guest.objects.filter(id__in=guest_ids).select_related("invitation__event")
+    schedules = {}
+    stale = {}
+    for guest in guests:
+        event = guest.invitation.event
+        if event.id not in schedules:
+            schedules[event.id] = get_event_schedules(event)
+        if guest.card_image and guest.card_fingerprint == guest_card_fingerprint(guest, schedules[event.id]):
+            if guest.render_status != "ready":
+                Guest.objects.filter(pk=guest.pk).update(render_status="ready")
+            continue
+        stale.setdefault(event.id, (event, []))[1].append(guest)
+
+    rendered = 0
+    for event_id, (event, event_guests) in stale.items():
+        failed = render_guest_cards(event, event_guests, events=schedules[event_id])
+        if failed:
+            Guest.objects.filter(pk__in=[guest.pk for guest in failed]).update(
+                render_status="failed"
+            )
+        rendered += len(event_guests) - len(failed)
+    return rendered
+
+
+@shared_task
+def rerender_stale_cards(event_id):
+    """Queue re-renders for the guests of an event whose cards were built
+    from different event-level inputs than the event has now."""
+    event = WeddingEvent.objects.filter(id=event_id).first()
+    if event is None:
+        return 0
+
+    fingerprint = event_card_fingerprint(event)
+    stale_ids = list(
+        Guest.objects.filter(invitation__event=event)
+        .exclude(card_image="")
+        .exclude(card_image__isnull=True)
+        .exclude(card_event_fingerprint=fingerprint)
+        .values_list("id", flat=True)
+    )
+    # Behind new guests' cards, and deferred while the queue is full
+    schedule_renders(
+        render_guest_card_batch,
+        stale_ids,
+        "rerender",
+        planner_id=event.planner_id,
+        chunk_size=RERENDER_CHUNK_SIZE,
+    )
+    return len(stale_ids)
+
+
+@shared_task
+def dispatch_deferred_renders():
+    """Queue deferred card renders again, soonest events first, as far as
+    the scheduler's limits allow. Run periodically by celery beat."""
+    deferred = Guest.objects.filter(render_status="deferred").order_by(
+        "invitation__event__date"
+    ).values_list("id", "invitation__event__planner_id", "card_image")
+
+    # New cards before re-renders, per planner
+    groups = {}
+    for guest_id, planner_id, card_image in deferred.iterator():
+        lane = "rerender" if card_image else "bulk"
+        groups.setdefault((planner_id, lane), []).append(guest_id)
+
+    queued = 0
+    for (planner_id, lane), guest_ids in sorted(groups.items(), key=lambda item: RENDER_LANES[item[0][1]]):
+        still_deferred = schedule_renders(
+            render_guest_card_batch,
+            guest_ids,
+            lane,
+            planner_id=planner_id,
+            chunk_size=RERENDER_CHUNK_SIZE,
+        )
+        queued += len(guest_ids) - len(still_deferred)
+    return queued
+
+
+@shared_task
+def build_print_sheet(event_id, page_size="a4", columns=2, rows=2, dpi=PRINT_DPI):
+    """Render every guest card of an event N-up into a print-ready PDF and
+    store it in media storage. Returns the stored file name."""
+    event = WeddingEvent.objects.filter(id=event_id).first()
+    if event is None:
+        return None
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        cards = iter_event_card_tiles(
+            event, dpi=print_card_dpi(page_size, columns, rows, dpi)
+        )
+        pages = write_print_pdf(cards, path, page_size, columns, rows, dpi)
+        if not pages:
+            return None
+
+        name = (
+            f"print_sheets/{slugify(event.title) or 'event'}-{event.id}-"
+            f"{page_size}-{columns}x{rows}-{now():%Y%m%d%H%M%S}.pdf"
+        )
+        with open(path, "rb") as pdf:
+            name = default_storage.save(name, File(pdf))
+    finally:
+        os.remove(path)
+
+    logger.info("Stored %d-page print sheet for event %s at %s", pages, event_id, name)
+    return name
+
+
+@shared_task
+def send_invitation_emails(dispatch_id):
+    """Send an invitation's emails and text messages in the background.
+    Returns the number sent."""
+    dispatch = (
+        InvitationDispatch.objects.select_related("invitation__event")
+        .filter(id=dispatch_id)
+        .first()
+    )
+    if dispatch is None:
+        return None
+    dispatch = deliver_invitations(dispatch)
+    if dispatch is None:
+        return None
+    logger.info(
+        "Sent %d of %d invitations for dispatch %s (%d failed)",
+        dispatch.sent, dispatch.total, dispatch_id, dispatch.failed,
+    )
+    return dispatch.sent
+
+
+@shared_task(bind=True, max_retries=SMS_MAX_RETRIES)
+def send_sms(self, to, body):
+    """Send one text message, e.g. a verification code, retrying
+    transient failures with backoff. Returns whether it was sent."""
+    (result,) = send_messages(get_sms_provider(), [SMSMessage(to, body)], max_retries=0)
+    if not result.sent:
+        if result.transient and self.request.retries < self.max_retries:
+            raise self.retry(countdown=2 ** self.request.retries)
+        logger.warning("Text message to %s not sent: %s", to, result.error)
+    return result.sent
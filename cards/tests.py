@@ -1,3 +1,811 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import smtplib
+import tempfile
+import time
+import uuid
+import zipfile
+from datetime import date, timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import skipIf
 
-# Create your tests here.
+from celery.signals import task_postrun
+from django.apps import apps
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, PdfParser
+from rest_framework.test import APIClient
+
+from utils import card_cache, generators, sms
+from utils.exporters import MISSING_FILES_NAME, iter_zip
+from utils.generators import scaled_card_size
+from utils.printing import print_card_dpi, write_print_pdf
+from utils.tokens import ExpiredToken, InvalidToken, event_tag, make_token, read_token
+from . import rendering, scheduler
+from .checkin import check_in_guest
+from .importers import GuestImportError, import_guests, read_guest_rows
+from .mailing import delivery_summary
+from .models import (
+    DeliveryLog, Guest, InvitationDispatch, QRVerification, User, WeddingEvent, WeddingPlanner,
+)
+from .rendering import guest_card_etag
+from .tasks import render_guest_card_batch, render_guest_card_task
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def guest_writes(queries):
+    """The INSERTs and UPDATEs of the guest table among ``queries``."""
+    return [
+        query["sql"]
+        for query in queries
+        if query["sql"].startswith(('INSERT INTO "cards_guest"', 'UPDATE "cards_guest"'))
+    ]
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CARD_CACHE={}, CARD_RENDER_MODE="eager")
+class GuestCreationQueryTests(TestCase):
+    """Creating a guest writes its row once, then once more with the card."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="planner@example.com", password="secret")
+        planner = WeddingPlanner.objects.get(user=cls.user)
+        event = WeddingEvent.objects.create(
+            planner=planner,
+            title="Wedding of Chanda & Mwila",
+            couple="Chanda & Mwila",
+            date=timezone.now() + timedelta(days=30),
+            venue="Lusaka",
+        )
+        cls.invitation = event.invitations.get()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create_and_render(self, create):
+        """Run ``create`` and the card render it queues; return the new guest
+        and the guest-table writes of each step."""
+        with CaptureQueriesContext(connection) as creating:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = create()
+        self.assertEqual(len(callbacks), 1)
+        guest = Guest.objects.get(invitation=self.invitation)
+        self.assertEqual(guest.render_status, "pending")
+
+        with CaptureQueriesContext(connection) as rendering:
+            render_guest_card_task.apply(args=[str(guest.pk)])
+        return response, guest, guest_writes(creating), guest_writes(rendering)
+
+    def assert_single_card_write(self, guest, render_writes):
+        self.assertEqual(len(render_writes), 1)
+        # Only the render's own fields, not the guest's details
+        self.assertIn('"card_image"', render_writes[0])
+        self.assertIn('"qr_code"', render_writes[0])
+        self.assertNotIn('"first_name"', render_writes[0])
+        self.assertNotIn('"checked_in"', render_writes[0])
+
+        guest.refresh_from_db()
+        self.assertEqual(guest.render_status, "ready")
+        self.assertTrue(guest.card_image)
+        self.assertTrue(guest.qr_code)
+
+    def test_htmx_add_guest(self):
+        self.client.force_login(self.user)
+        response, guest, create_writes, render_writes = self.create_and_render(
+            lambda: self.client.post(
+                reverse("add_guest"),
+                {"invitation": self.invitation.id, "first_name": "Mutale", "email": "mutale@example.com"},
+                HTTP_HX_REQUEST="true",
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(create_writes), 1)
+        self.assertTrue(create_writes[0].startswith("INSERT"))
+        self.assert_single_card_write(guest, render_writes)
+
+    def test_api_create_guest(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response, guest, create_writes, render_writes = self.create_and_render(
+            lambda: client.post(
+                "/api/guests/",
+                {"invitation_id": str(self.invitation.id), "first_name": "Bwalya"},
+                format="json",
+            )
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(create_writes), 1)
+        self.assertTrue(create_writes[0].startswith("INSERT"))
+        self.assert_single_card_write(guest, render_writes)
+
+    def test_etag_follows_stored_card(self):
+        guest = Guest.objects.create(invitation=self.invitation, first_name="Chileshe")
+        render_guest_card_task.apply(args=[str(guest.pk)])
+        guest.refresh_from_db()
+        stored = guest_card_etag(guest)
+
+        # The event changes; until the re-render lands, the old card keeps its tag
+        WeddingEvent.objects.filter(pk=self.invitation.event_id).update(venue="Ndola")
+        guest = Guest.objects.select_related("invitation__event").get(pk=guest.pk)
+        self.assertEqual(guest_card_etag(guest), stored)
+
+        render_guest_card_task.apply(args=[str(guest.pk)])
+        guest = Guest.objects.select_related("invitation__event").get(pk=guest.pk)
+        self.assertNotEqual(guest_card_etag(guest), stored)
+        self.assertEqual(guest_card_etag(guest), f'"{guest.card_fingerprint}"')
+
+    def test_fingerprint_backfill_keeps_existing_cards(self):
+        guest = Guest.objects.create(invitation=self.invitation, first_name="Chileshe")
+        render_guest_card_task.apply(args=[str(guest.pk)])
+        # As left by 0007 for events and cards that predate it
+        WeddingEvent.objects.filter(pk=self.invitation.event_id).update(card_fingerprint="")
+        Guest.objects.filter(pk=guest.pk).update(card_event_fingerprint="")
+
+        backfill = import_module("cards.migrations.0013_backfill_card_fingerprints")
+        backfill.backfill_card_fingerprints(apps, connection.schema_editor())
+
+        event = WeddingEvent.objects.get(pk=self.invitation.event_id)
+        guest.refresh_from_db()
+        self.assertEqual(guest.card_event_fingerprint, event.card_fingerprint)
+        with self.captureOnCommitCallbacks() as callbacks:
+            event.save()
+        self.assertEqual(callbacks, [])
+
+    @override_settings(CARD_RENDER_WORKERS=2)
+    def test_batch_renders_on_process_pool(self):
+        guests = Guest.objects.bulk_create([
+            Guest(invitation=self.invitation, first_name=name) for name in ("Mutale", "Bwalya", "Phiri")
+        ])
+        self.assertEqual(render_guest_card_batch([str(guest.pk) for guest in guests]), 3)
+        for guest in Guest.objects.filter(invitation=self.invitation):
+            self.assertEqual(guest.render_status, "ready")
+            self.assertTrue(guest.card_image)
+            self.assertTrue(guest.card_thumbnail)
+            self.assertTrue(guest.qr_code)
+            self.assertEqual(guest_card_etag(guest), f'"{guest.card_fingerprint}"')
+
+    @override_settings(CARD_RENDER_WORKERS=2)
+    def test_batch_in_daemonic_worker_renders_in_process(self):
+        guests = Guest.objects.bulk_create([
+            Guest(invitation=self.invitation, first_name=name) for name in ("Mutale", "Bwalya")
+        ])
+        process = multiprocessing.current_process()
+        process.daemon = True
+        rendering._pool_unavailable_warned.clear()
+        try:
+            with self.assertLogs("cards.rendering", "WARNING") as logs:
+                rendered = render_guest_card_batch([str(guest.pk) for guest in guests])
+        finally:
+            process.daemon = False
+        self.assertEqual(rendered, 2)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("--pool=threads", logs.records[0].getMessage())
+
+    def test_rerender_deletes_replaced_files(self):
+        guest = Guest.objects.create(invitation=self.invitation, first_name="Chileshe")
+        render_guest_card_task.apply(args=[str(guest.pk)])
+        guest.refresh_from_db()
+        old_files = [guest.card_image, guest.card_thumbnail, guest.card_preview, guest.qr_code]
+
+        WeddingEvent.objects.filter(pk=self.invitation.event_id).update(venue="Ndola")
+        with self.captureOnCommitCallbacks(execute=True):
+            render_guest_card_task.apply(args=[str(guest.pk)])
+
+        guest.refresh_from_db()
+        for old_file in old_files:
+            self.assertFalse(old_file.storage.exists(old_file.name), old_file.name)
+        for new_file in (guest.card_image, guest.card_thumbnail, guest.card_preview, guest.qr_code):
+            self.assertTrue(new_file.storage.exists(new_file.name), new_file.name)
+
+    def test_render_is_idempotent(self):
+        guest = Guest.objects.create(invitation=self.invitation, first_name="Chileshe")
+        render_guest_card_task.apply(args=[str(guest.pk)])
+        with CaptureQueriesContext(connection) as rerendering:
+            render_guest_card_task.apply(args=[str(guest.pk)])
+        self.assertEqual(guest_writes(rerendering), [])
+
+
+class RefusingEmailBackend(LocmemEmailBackend):
+    """Local SMTP stand-in that refuses recipients at example.invalid."""
+
+    def send_messages(self, messages):
+        for message in messages:
+            refused = [to for to in message.to if to.endswith("@example.invalid")]
+            if refused:
+                raise smtplib.SMTPRecipientsRefused(
+                    {to: (550, b"No such user") for to in refused}
+                )
+        return super().send_messages(messages)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    CARD_RENDER_MODE="lazy",
+    EMAIL_BACKEND="cards.tests.RefusingEmailBackend",
+    INVITATION_EMAIL_RATE=0,
+    SMS_PROVIDERS={"default": {"BACKEND": "locmem"}},
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class InvitationDeliveryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="planner@example.com", password="secret")
+        cls.planner = WeddingPlanner.objects.get(user=cls.user)
+        cls.event = WeddingEvent.objects.create(
+            planner=cls.planner,
+            title="Wedding of Chanda & Mwila",
+            couple="Chanda & Mwila",
+            date=timezone.now() + timedelta(days=30),
+            venue="Lusaka",
+        )
+        cls.invitation = cls.event.invitations.get()
+        Guest.objects.bulk_create([
+            Guest(invitation=cls.invitation, first_name="Mutale", email="mutale@example.com"),
+            Guest(invitation=cls.invitation, first_name="Bwalya", email="bwalya@example.com"),
+            Guest(invitation=cls.invitation, first_name="Chileshe", email="chileshe@example.invalid"),
+            Guest(invitation=cls.invitation, first_name="Phiri", phone="+260977123456"),
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        sms.outbox.clear()
+
+    def send(self, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url)
+
+    def test_send_logs_each_delivery(self):
+        self.send(reverse("send_invitations", args=[self.invitation.id]))
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            "bwalya@example.com", "mutale@example.com",
+        ])
+        # Guests with only a phone number are texted their card link
+        self.assertEqual([message.to for message in sms.outbox], ["+260977123456"])
+        phiri = Guest.objects.get(first_name="Phiri")
+        self.assertIn(reverse("invitation_card", args=[str(phiri.id)]), sms.outbox[0].body)
+
+        dispatch = InvitationDispatch.objects.get()
+        self.assertEqual(
+            (dispatch.status, dispatch.total, dispatch.sent, dispatch.failed), ("done", 4, 3, 1)
+        )
+
+        logs = {log.guest.first_name: log for log in DeliveryLog.objects.select_related("guest")}
+        self.assertEqual(sorted(logs), ["Bwalya", "Chileshe", "Mutale", "Phiri"])
+        self.assertEqual((logs["Phiri"].channel, logs["Phiri"].status), ("sms", "sent"))
+        self.assertEqual(logs["Mutale"].status, "sent")
+        self.assertEqual(logs["Mutale"].attempts, 1)
+        self.assertIsNotNone(logs["Mutale"].latency_ms)
+        # Permanent refusals aren't retried
+        self.assertEqual(logs["Chileshe"].status, "failed")
+        self.assertEqual(logs["Chileshe"].attempts, 1)
+        self.assertIn("No such user", logs["Chileshe"].error)
+
+    def test_summary_counts_per_event(self):
+        self.send(reverse("send_invitations", args=[self.invitation.id]))
+
+        with self.assertNumQueries(1):
+            summary = delivery_summary(self.planner)
+        counts = summary[self.event.id]
+        self.assertEqual((counts["sent"], counts["failed"], counts["pending"]), (3, 1, 0))
+
+        response = self.client.get(reverse("profile"))
+        self.assertContains(response, reverse("retry_failed_deliveries", args=[self.event.id]))
+
+    def test_retry_failed(self):
+        self.send(reverse("send_invitations", args=[self.invitation.id]))
+        Guest.objects.filter(first_name="Chileshe").update(email="chileshe@example.com")
+        mail.outbox = []
+
+        self.send(reverse("retry_failed_deliveries", args=[self.event.id]))
+
+        self.assertEqual([message.to[0] for message in mail.outbox], ["chileshe@example.com"])
+        log = DeliveryLog.objects.get(guest__first_name="Chileshe")
+        self.assertEqual((log.status, log.attempts, log.error), ("sent", 2, ""))
+        self.assertEqual(InvitationDispatch.objects.count(), 2)
+        self.assertEqual(DeliveryLog.objects.count(), 4)
+        counts = delivery_summary(self.planner)[self.event.id]
+        self.assertEqual((counts["sent"], counts["failed"]), (4, 0))
+
+    def test_retry_picks_up_stale_dispatch(self):
+        # A worker died mid-send: the dispatch stays "sending", its logs pending
+        dispatch = InvitationDispatch.objects.create(
+            invitation=self.invitation,
+            status="sending",
+            total=1,
+            updated_at=timezone.now() - timedelta(hours=1),
+        )
+        DeliveryLog.objects.create(
+            guest=Guest.objects.get(first_name="Mutale"), dispatch=dispatch
+        )
+
+        self.send(reverse("retry_failed_deliveries", args=[self.event.id]))
+
+        dispatch.refresh_from_db()
+        self.assertEqual(dispatch.status, "failed")
+        self.assertFalse(dispatch.is_active)
+        self.assertEqual([message.to[0] for message in mail.outbox], ["mutale@example.com"])
+        self.assertEqual(DeliveryLog.objects.get().status, "sent")
+
+
+class FlakySMSProvider(sms.LocmemSMSProvider):
+    """Fails its first batch as a whole, then refuses numbers ending in 0."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+
+    def send_batch(self, messages):
+        self.calls += 1
+        if self.calls == 1:
+            raise sms.SMSError("Gateway timeout")
+        errors = [
+            sms.SMSError("Unknown subscriber", transient=False) if message.to.endswith("0") else None
+            for message in messages
+        ]
+        super().send_batch([m for m, error in zip(messages, errors) if error is None])
+        return errors
+
+
+class SMSTransportTests(SimpleTestCase):
+    def setUp(self):
+        sms.outbox.clear()
+
+    def test_retries_transient_failures_with_backoff(self):
+        provider = FlakySMSProvider(batch_size=2)
+        messages = [sms.SMSMessage(f"+26097712345{n}", "Hi") for n in range(3)]
+        waits = []
+
+        results = sms.send_messages(provider, messages, max_retries=3, sleep=waits.append)
+
+        self.assertEqual([result.sent for result in results], [False, True, True])
+        # The failed batch was sent again; the refused number wasn't retried
+        self.assertEqual([result.attempts for result in results], [2, 2, 1])
+        self.assertEqual(waits, [1.0])
+        self.assertEqual([message.to for message in sms.outbox], [
+            "+260977123451", "+260977123452",
+        ])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CARD_RENDER_MODE="lazy")
+class CheckInTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="planner@example.com", password="secret")
+        event = WeddingEvent.objects.create(
+            planner=WeddingPlanner.objects.get(user=cls.user),
+            title="Wedding of Chanda & Mwila",
+            couple="Chanda & Mwila",
+            date=timezone.now() + timedelta(days=30),
+            venue="Lusaka",
+        )
+        cls.guest = Guest.objects.create(invitation=event.invitations.get(), first_name="Mutale")
+
+    def test_checks_in_once(self):
+        with self.assertNumQueries(2):
+            self.assertTrue(check_in_guest(self.guest))
+        # A second device scanning the same card, from its own copy of the row
+        stale = Guest.objects.get(pk=self.guest.pk)
+        stale.checked_in = False
+        with self.assertNumQueries(2):
+            self.assertFalse(check_in_guest(stale))
+
+        self.assertEqual(stale.check_in_time, self.guest.check_in_time)
+        verification = QRVerification.objects.get(guest=self.guest)
+        self.assertTrue(verification.is_valid)
+
+    def test_existing_verification_does_not_block_check_in(self):
+        QRVerification.objects.create(guest=self.guest)
+        with self.assertNumQueries(2):
+            self.assertTrue(check_in_guest(self.guest))
+        verification = QRVerification.objects.get(guest=self.guest)
+        self.assertTrue(verification.is_valid)
+        self.assertTrue(Guest.objects.get(pk=self.guest.pk).checked_in)
+
+    def test_entry_points_report_already_checked_in(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f"/api/guests/{self.guest.pk}/check_in/"
+        self.assertEqual(client.post(url).status_code, 200)
+        self.assertEqual(client.post(url).status_code, 400)
+        response = client.post(
+            "/api/verifications/verify_guest/", {"guest_id": str(self.guest.pk)}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(reverse("verify_invitation", args=[self.guest.pk]))
+        self.assertContains(response, "This invitation has already been used.")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CARD_RENDER_MODE="lazy")
+class VerifyTokenTests(TestCase):
+    """Signed QR tokens are checked without the database, and anything
+    forged, malformed or expired is turned away before any query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email="planner@example.com", password="secret")
+        cls.event = WeddingEvent.objects.create(
+            planner=WeddingPlanner.objects.get(user=user),
+            title="Wedding of Chanda & Mwila",
+            couple="Chanda & Mwila",
+            date=timezone.now() + timedelta(days=30),
+            venue="Lusaka",
+        )
+        cls.guest = Guest.objects.create(invitation=cls.event.invitations.get(), first_name="Mutale")
+
+    def token(self, event_id=None, expires=None):
+        return make_token(
+            self.guest.id,
+            event_id or self.event.id,
+            expires or timezone.now().date() + timedelta(days=1),
+        )
+
+    def verify(self, token):
+        return self.client.get(reverse("verify_token", args=[token]))
+
+    def test_round_trip(self):
+        expires = date(2030, 5, 17)
+        token = make_token(self.guest.id, self.event.id, expires)
+        self.assertEqual(len(token), 50)
+        self.assertEqual(
+            read_token(token, today=date(2030, 5, 17)),
+            (self.guest.id, event_tag(self.event.id), expires),
+        )
+
+        response = self.verify(self.token())
+        self.assertContains(response, "Invitation verified successfully!")
+        self.assertTrue(Guest.objects.get(pk=self.guest.pk).checked_in)
+
+    def test_tampered_mac(self):
+        raw = bytearray(base64.b32decode(self.token() + "=" * 6))
+        raw[-1] ^= 1
+        tampered = base64.b32encode(bytes(raw)).decode("ascii").rstrip("=")
+        with self.assertRaisesMessage(InvalidToken, "Bad signature"):
+            read_token(tampered)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify(tampered).status_code, 403)
+
+    def test_malformed(self):
+        token = self.token()
+        for malformed in (token[:-8], token + "AAAAAAAA", "1" + token[1:]):
+            with self.subTest(token=malformed):
+                with self.assertRaisesMessage(InvalidToken, "Malformed token"):
+                    read_token(malformed)
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.verify(malformed).status_code, 403)
+
+    def test_expired(self):
+        token = self.token(expires=timezone.now().date() - timedelta(days=1))
+        with self.assertRaises(ExpiredToken):
+            read_token(token)
+        with self.assertNumQueries(0):
+            response = self.verify(token)
+        self.assertEqual(response.status_code, 410)
+        self.assertFalse(Guest.objects.get(pk=self.guest.pk).checked_in)
+
+    def test_wrong_event(self):
+        response = self.verify(self.token(event_id=uuid.uuid4()))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Guest.objects.get(pk=self.guest.pk).checked_in)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    CARD_CACHE={},
+    CARD_RENDER_MODE="eager",
+    CARD_RENDER_WORKERS=1,
+    CELERY_TASK_ALWAYS_EAGER=True,
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "render_scheduler": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "import-tests",
+        },
+    },
+)
+class GuestImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="planner@example.com", password="secret")
+        event = WeddingEvent.objects.create(
+            planner=WeddingPlanner.objects.get(user=cls.user),
+            title="Wedding of Chanda & Mwila",
+            couple="Chanda & Mwila",
+            date=timezone.now() + timedelta(days=30),
+            venue="Lusaka",
+        )
+        cls.invitation = event.invitations.get()
+        Guest.objects.create(
+            invitation=cls.invitation, first_name="Mutale", email="mutale@example.com"
+        )
+
+    def upload(self, name, content, **params):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f"/api/invitations/{self.invitation.id}/import/"
+        if params:
+            url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = client.post(
+                url, {"file": SimpleUploadedFile(name, content)}, format="multipart"
+            )
+        return response, callbacks
+
+    def test_csv_with_loose_headers(self):
+        rows = read_guest_rows(
+            io.BytesIO("\ufeffFirst Name,Last Name,E-mail,Phone\nBwalya,Phiri,,0977 123456\n".encode()),
+            filename="guests.csv",
+        )
+        self.assertEqual(rows, [
+            {"first_name": "Bwalya", "last_name": "Phiri", "e-mail": "", "phone": "0977 123456"},
+        ])
+
+        guests, errors = import_guests(self.invitation, rows, region="ZM")
+        self.assertEqual(errors, [])
+        self.assertEqual(guests[0].phone, "+260977123456")
+        self.assertIsNone(guests[0].email)
+
+    def test_errors_per_row(self):
+        response, _ = self.upload("guests.csv", (
+            "first_name,email,phone,payment_amount\n"
+            "Bwalya,bwalya@example.com,,\n"
+            ",,,\n"
+            "Chileshe,not-an-email,,\n"
+            "Phiri,,12,\n"
+            ",nobody@example.com,,\n"
+            "Again,MUTALE@example.com,,\n"
+            "Twice,bwalya@example.com,,-5\n"
+            "Long,,+498001234567890,\n"
+        ).encode())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["failed_rows"], 6)
+        errors = {(error["row"], error["field"]) for error in response.data["errors"]}
+        # Row 2 is blank and skipped
+        self.assertEqual(errors, {
+            (3, "email"),
+            (4, "phone"),
+            (5, None),
+            (6, "email"),
+            (7, "payment_amount"),
+            # Valid, but one character longer than Guest.phone
+            (8, "phone"),
+        })
+        self.assertEqual(
+            sorted(self.invitation.guests.values_list("first_name", flat=True)),
+            ["Bwalya", "Mutale"],
+        )
+
+    def test_json_upload(self):
+        response, _ = self.upload("guests.json", json.dumps({"guests": [
+            {"guest_name": "The Bandas"},
+            {"first_name": "Mutale", "email": "mutale@example.com"},
+        ]}).encode())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["failed_rows"]), (1, 1))
+
+        response, _ = self.upload("guests.json", b"{not json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["error"], "The file is not valid JSON.")
+        with self.assertRaises(GuestImportError):
+            read_guest_rows({"guests": "Bwalya"})
+
+    def test_queries_do_not_grow_with_rows(self):
+        def import_count(count):
+            rows = [{"first_name": f"Guest {n}", "email": f"g{count}-{n}@example.com"} for n in range(count)]
+            with CaptureQueriesContext(connection) as queries:
+                import_guests(self.invitation, rows)
+            return len(queries)
+
+        self.assertEqual(import_count(2), import_count(50))
+
+    def test_renders_after_commit(self):
+        response, callbacks = self.upload(
+            "guests.csv", b"first_name\nBwalya\nChileshe\n"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(callbacks), 1)
+        imported = Guest.objects.filter(id__in=response.data["guest_ids"])
+        self.assertEqual(
+            list(imported.values_list("render_status", "card_image")), [("pending", "")] * 2
+        )
+
+        callbacks[0]()
+        for guest in imported:
+            self.assertEqual(guest.render_status, "ready")
+            self.assertTrue(guest.card_image)
+
+
+class RecordingTask:
+    """Stands in for a render task, keeping what was queued instead of running it."""
+
+    def __init__(self):
+        self.queued = []
+
+    def apply_async(self, args=None, kwargs=None, priority=None):
+        self.queued.append((args, kwargs, priority))
+
+
+@override_settings(
+    RENDER_QUEUE_MAX_DEPTH=3,
+    RENDER_PLANNER_MAX_CHUNKS=4,
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "render_scheduler": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "scheduler-tests",
+        },
+    },
+)
+class RenderSchedulerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(email="planner@example.com", password="secret")
+        cls.planner = WeddingPlanner.objects.get(user=user)
+        event = WeddingEvent.objects.create(
+            planner=cls.planner,
+            title="Wedding of Chanda & Mwila",
+            couple="Chanda & Mwila",
+            date=timezone.now() + timedelta(days=30),
+            venue="Lusaka",
+        )
+        cls.guests = Guest.objects.bulk_create([
+            Guest(invitation=event.invitations.get(), first_name=f"Guest {n}") for n in range(5)
+        ])
+
+    def setUp(self):
+        scheduler._scheduler_cache().clear()
+
+    def planner_chunks(self):
+        return scheduler._scheduler_cache().get(f"render:planner:{self.planner.pk}", 0)
+
+    def test_bulk_lane_defers_when_saturated(self):
+        task = RecordingTask()
+        guest_ids = [str(guest.pk) for guest in self.guests]
+        deferred = scheduler.schedule_renders(
+            task, guest_ids, "bulk", planner_id=self.planner.pk, chunk_size=2
+        )
+
+        # The first chunk fits under the depth limit of 3; the second would not
+        self.assertEqual(len(task.queued), 1)
+        args, kwargs, priority = task.queued[0]
+        self.assertEqual(args, [guest_ids[:2]])
+        self.assertEqual(priority, scheduler.RENDER_LANES["bulk"])
+        self.assertEqual(deferred, guest_ids[2:])
+        self.assertEqual(
+            set(Guest.objects.filter(render_status="deferred").values_list("id", flat=True)),
+            {guest.pk for guest in self.guests[2:]},
+        )
+        self.assertEqual(scheduler.lane_depth("bulk"), 2)
+        # Rejected chunks give their planner slot back
+        self.assertEqual(self.planner_chunks(), 1)
+
+    def test_counters_released_when_task_finishes_not_on_retry(self):
+        task = RecordingTask()
+        for guest in self.guests[:2]:
+            scheduler.schedule_renders(
+                task, [str(guest.pk)], "bulk", planner_id=self.planner.pk
+            )
+        self.assertEqual((scheduler.lane_depth("bulk"), self.planner_chunks()), (2, 2))
+
+        (_, success_kwargs, _), (_, failure_kwargs, _) = task.queued
+        task_postrun.send(sender=None, kwargs=failure_kwargs, state="RETRY")
+        self.assertEqual((scheduler.lane_depth("bulk"), self.planner_chunks()), (2, 2))
+
+        task_postrun.send(sender=None, kwargs=success_kwargs, state="SUCCESS")
+        self.assertEqual((scheduler.lane_depth("bulk"), self.planner_chunks()), (1, 1))
+        task_postrun.send(sender=None, kwargs=failure_kwargs, state="FAILURE")
+        self.assertEqual((scheduler.lane_depth("bulk"), self.planner_chunks()), (0, 0))
+
+        # Nothing is held now, so the lane takes a full chunk again
+        deferred = scheduler.schedule_renders(
+            task, [str(guest.pk) for guest in self.guests[2:]], "bulk", planner_id=self.planner.pk
+        )
+        self.assertEqual(deferred, [])
+
+
+class CardCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location, ignore_errors=True)
+
+    def test_filesystem_cache_evicts_least_recently_used(self):
+        entry = {"card": ("card.png", b"x" * 100)}
+        entry_size = len(card_cache._pack(entry))
+        cache = card_cache.FileSystemCardCache(self.location, int(entry_size * 3.5))
+        for age, key in enumerate(("cc", "bb", "aa")):
+            cache.set(key, entry)
+            # Oldest first, without waiting on the clock
+            then = time.time() - 100 + age
+            os.utime(cache._path(key), (then, then))
+
+        self.assertEqual(cache.get("cc"), entry)
+        cache.set("dd", entry)
+
+        self.assertIsNone(cache.get("bb"))
+        for key in ("cc", "aa", "dd"):
+            self.assertEqual(cache.get(key), entry)
+        self.assertEqual(cache.stats(), {"hits": 4, "misses": 1})
+
+    @skipIf(generators.np is None, "NumPy is not installed")
+    def test_raster_backends_do_not_share_entries(self):
+        event = SimpleNamespace(
+            id=1, title="Wedding of Chanda & Mwila", couple="Chanda & Mwila",
+            date=date(2026, 12, 12), venue="Lusaka",
+        )
+        with override_settings(CARD_CACHE={"BACKEND": "filesystem", "LOCATION": self.location}):
+            cache = card_cache.get_card_cache()
+            generators.generate_card_files(event, invitee_name="Mutale", raster="pil")
+            generators.generate_card_files(event, invitee_name="Mutale", raster="pil")
+            generators.generate_card_files(event, invitee_name="Mutale", raster="numpy")
+            self.assertEqual(cache.stats(), {"hits": 1, "misses": 2})
+
+
+class TruncatingStorage(FileSystemStorage):
+    """Local storage whose reads fail after the first chunk."""
+
+    def open(self, name, mode="rb"):
+        file = super().open(name, mode)
+
+        def chunks(chunk_size=None):
+            yield file.read(chunk_size)
+            raise OSError("Connection reset by peer")
+
+        file.chunks = chunks
+        return file
+
+
+class CardExportTests(SimpleTestCase):
+    def test_unreadable_files_are_listed_not_truncating_the_archive(self):
+        with tempfile.TemporaryDirectory() as location:
+            storage = FileSystemStorage(location=location)
+            storage.save("ok.png", ContentFile(b"complete card"))
+            storage.save("cut.png", ContentFile(b"partial card"))
+            entries = [
+                ("cards/ok.png", SimpleNamespace(storage=storage, name="ok.png")),
+                ("cards/gone.png", SimpleNamespace(storage=storage, name="gone.png")),
+                ("cards/cut.png", SimpleNamespace(storage=TruncatingStorage(location=location), name="cut.png")),
+            ]
+            with self.assertLogs("utils.exporters", "ERROR"):
+                data = b"".join(iter_zip(entries, chunk_size=4))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ["cards/ok.png", "cards/cut.png", MISSING_FILES_NAME])
+            self.assertEqual(archive.read("cards/ok.png"), b"complete card")
+            self.assertEqual(archive.read("cards/cut.png"), b"part")
+            self.assertEqual(
+                archive.read(MISSING_FILES_NAME).decode().splitlines(),
+                ["cards/gone.png: missing", "cards/cut.png: incomplete"],
+            )
+
+
+class PrintSheetTests(SimpleTestCase):
+    def test_writes_hundreds_of_pages_in_one_pass(self):
+        card_px = scaled_card_size(print_card_dpi(columns=1, rows=1, dpi=20))
+        cards = (Image.new("RGB", card_px, (n % 256, 0, 0)) for n in range(300))
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf:
+            self.assertEqual(write_print_pdf(cards, pdf.name, columns=1, rows=1, dpi=20), 300)
+            written = PdfParser.PdfParser(pdf.name)
+            self.assertEqual(len(written.pages), 300)
+            # One xref table, not one per appended page
+            self.assertEqual(pdf.read().count(b"startxref"), 1)
+            written.close()
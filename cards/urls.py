@@ -4,7 +4,8 @@ from .views import profile, send_invitations
 from cards import views
 from .api_views import (
     CustomAuthToken, WeddingPlannerViewSet, WeddingEventViewSet,
-    EventScheduleViewSet, InvitationViewSet, GuestViewSet, QRVerificationViewSet
+    EventScheduleViewSet, InvitationViewSet, GuestViewSet, QRVerificationViewSet,
+    RenderMetricsView,
 )
 
 # API Router setup
@@ -23,16 +24,34 @@ urlpatterns = [
         send_invitations,
         name="send_invitations",
     ),
+    path(
+        "invitation/dispatch/<uuid:dispatch_id>/",
+        views.dispatch_progress,
+        name="dispatch_progress",
+    ),
     path("", profile, name="profile"),
     path("profile/add-event/", views.add_event, name="add_event"),
     path("profile/add-guest/", views.add_guest, name="add_guest"),
     path("profile/load-event-form/", views.load_event_form, name="load_event_form"),
     path("profile/load-guest-form/", views.load_guest_form, name="load_guest_form"),
     path("event/<uuid:event_id>/", views.event_detail, name="event_detail"),
+    path(
+        "event/<uuid:event_id>/deliveries/retry/",
+        views.retry_failed_deliveries,
+        name="retry_failed_deliveries",
+    ),
+    path(
+        "event/<uuid:event_id>/cards.zip",
+        views.export_event_cards,
+        name="export_event_cards",
+    ),
     path("verify/<uuid:guest_id>/", views.verify_invitation, name="verify_invitation"),
+    # Upper case, like the tokens, so signed QR codes stay alphanumeric
+    path("V/<str:token>/", views.verify_token, name="verify_token"),
     path("invitation/<uuid:pk>/", views.invitation_card_view, name="invitation_card"),
     
     # API URLs
     path("api/auth/", CustomAuthToken.as_view(), name="api_auth"),
+    path("api/render-metrics/", RenderMetricsView.as_view(), name="render_metrics"),
     path("api/", include(router.urls)),
 ]
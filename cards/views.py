@@ -1,22 +1,60 @@
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
-from django.core.mail import EmailMessage
-from django.conf import settings
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Count, Q
+from django.template.defaultfilters import pluralize
 from django.template.loader import render_to_string
 from django.contrib import messages
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.text import slugify
 from django.utils.timezone import now
+from django.views.decorators.http import require_POST
 
 
-from .models import Invitation, Guest, QRVerification, WeddingPlanner, WeddingEvent
+from .checkin import check_in_guest
+from .mailing import delivery_summary, expire_stale_dispatches
+from .models import (
+    DeliveryLog, Invitation, InvitationDispatch, Guest, WeddingPlanner,
+    WeddingEvent,
+)
 from .forms import GuestForm, WeddingEventForm
-from PIL import Image
-from io import BytesIO
+from .rendering import card_render_mode, ensure_guest_card
+from .tasks import send_invitation_emails
+from utils.exporters import iter_zip
+from utils.tokens import ExpiredToken, InvalidToken, event_tag, read_token
+
+
+def _queue_dispatch(invitation, deliveries=None, logs=None):
+    """Create a dispatch for ``invitation`` and queue it once committed.
+
+    Either new pending logs are written for ``deliveries``, ``(guest_id,
+    channel)`` pairs, in bulk, or existing ``logs`` (e.g. failed deliveries) are moved to the new
+    dispatch and reset to pending.
+    """
+    with transaction.atomic():
+        dispatch = InvitationDispatch.objects.create(invitation=invitation)
+        if logs is not None:
+            dispatch.total = logs.update(
+                dispatch=dispatch, status="pending", error="", updated_at=now()
+            )
+        else:
+            dispatch.total = len(DeliveryLog.objects.bulk_create(
+                [
+                    DeliveryLog(guest_id=guest_id, channel=channel, dispatch=dispatch)
+                    for guest_id, channel in deliveries
+                ],
+                batch_size=500,
+            ))
+        dispatch.save(update_fields=["total"])
+        transaction.on_commit(lambda: send_invitation_emails.delay(str(dispatch.id)))
+    return dispatch
 
 
 @login_required
+@require_POST
 def send_invitations(request, invitation_id):
+    """Queue the invitation's emails, and text messages to guests with
+    only a phone number; progress is shown on the profile."""
     invitation = get_object_or_404(Invitation, id=invitation_id)
     if invitation.event.planner.user != request.user:
         messages.error(
@@ -24,57 +62,73 @@ def send_invitations(request, invitation_id):
         )
         return redirect("profile")
 
-    if not invitation.card_image or not invitation.qr_code:
-        messages.error(request, "Invitation is missing card image or QR code.")
+    expire_stale_dispatches(invitation.dispatches.all())
+    if invitation.dispatches.filter(status__in=["queued", "sending"]).exists():
+        messages.warning(request, "These invitations are already being sent.")
         return redirect("profile")
 
-    card = Image.open(invitation.card_image.path)
-    qr = Image.open(invitation.qr_code.path)
-    qr = qr.resize((100, 100))
-    card.paste(qr, (card.width - 110, card.height - 110))
-    buffer = BytesIO()
-    card.save(buffer, format="PNG")
-    invitation_image = buffer.getvalue()
-
-    guests = invitation.guests.all()
+    guests = list(invitation.guests.values_list("id", "email", "phone"))
     if not guests:
         messages.error(request, "No guests found for this invitation.")
         return redirect("profile")
+    deliveries = [
+        (guest_id, "email" if email else "sms")
+        for guest_id, email, phone in guests
+        if email or phone
+    ]
+    missing = len(guests) - len(deliveries)
+    if missing:
+        messages.warning(
+            request,
+            f"{missing} guest{pluralize(missing)} without an email address or phone number "
+            "will be skipped.",
+        )
+    if not deliveries:
+        return redirect("profile")
 
-    for guest in guests:
-        if not guest.email:
-            messages.warning(request, f"No email provided for guest {guest}.")
-            continue
+    dispatch = _queue_dispatch(invitation, deliveries=deliveries)
+    messages.success(request, f"Sending {dispatch.total} invitation{pluralize(dispatch.total)}.")
+    return redirect("profile")
 
-        context = {
-            "guest": guest,
-            "invitation": invitation,
-            "event": invitation.event,
-            "site_name": "Wedding Reservation System",
-        }
-        email_subject = f"Invitation to {invitation.event.title}"
-        email_body = render_to_string("account/email/invitation_email.html", context)
-
-        email = EmailMessage(
-            subject=email_subject,
-            body=email_body,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[guest.email],
+
+@login_required
+@require_POST
+def retry_failed_deliveries(request, event_id):
+    """Send the event's failed invitations again."""
+    event = get_object_or_404(WeddingEvent, id=event_id, planner__user=request.user)
+    retried = 0
+    expire_stale_dispatches(InvitationDispatch.objects.filter(invitation__event=event))
+    for invitation in event.invitations.all():
+        if invitation.dispatches.filter(status__in=["queued", "sending"]).exists():
+            messages.warning(request, "Invitations for this event are still being sent.")
+            continue
+        # Failed sends, and those left pending by a dispatch that failed
+        # or went stale before reaching them
+        failed = DeliveryLog.objects.filter(guest__invitation=invitation).filter(
+            Q(status="failed")
+            | Q(status="pending", dispatch__status="failed")
+            | Q(status="pending", dispatch__isnull=True)
         )
-        email.content_subtype = "html"
-        email.attach(f"invitation_{invitation.id}.png", invitation_image, "image/png")
-
-        try:
-            email.send()
-            messages.success(request, f"Invitation sent to {guest.email}.")
-        except Exception as e:
-            messages.error(
-                request, f"Failed to send invitation to {guest.email}: {str(e)}"
-            )
+        if failed.exists():
+            retried += _queue_dispatch(invitation, logs=failed).total
 
+    if retried:
+        messages.success(request, f"Retrying {retried} invitation{pluralize(retried)}.")
+    else:
+        messages.info(request, "There are no failed invitations to retry.")
     return redirect("profile")
 
 
+@login_required
+def dispatch_progress(request, dispatch_id):
+    dispatch = get_object_or_404(
+        InvitationDispatch.objects.select_related("invitation__event"),
+        id=dispatch_id,
+        invitation__event__planner__user=request.user,
+    )
+    return render(request, "partials/dispatch_progress.html", {"dispatch": dispatch})
+
+
 @login_required
 def profile(request):
     try:
@@ -90,11 +144,21 @@ def profile(request):
     )
     invitations = Invitation.objects.filter(event__planner=planner)
     event_form = WeddingEventForm()
+    dispatches = InvitationDispatch.objects.filter(
+        invitation__event__planner=planner
+    ).select_related("invitation__event").order_by("-created_at")[:5]
+
+    summary = delivery_summary(planner)
+    deliveries = [
+        {"event": event, **summary[event.id]} for event in events if event.id in summary
+    ]
 
     context = {
         "events": events,
         "invitations": invitations,
         "event_form": event_form,
+        "dispatches": dispatches,
+        "deliveries": deliveries,
     }
     return render(request, "profile.html", context)
 
@@ -242,12 +306,87 @@ def event_detail(request, event_id):
     )
 
 
+def _guest_export_entries(guests, include_qr):
+    for guest in guests:
+        base_name = "-".join(
+            part for part in (slugify(guest.first_name or ""), str(guest.id)) if part
+        )
+        extension = guest.card_image.name.rsplit(".", 1)[-1]
+        yield f"cards/{base_name}.{extension}", guest.card_image
+        if include_qr and guest.qr_code:
+            yield f"qr_codes/{base_name}.png", guest.qr_code
+
+
+@login_required
+def export_event_cards(request, event_id):
+    """Download every rendered card for an event as one ZIP, optionally
+    with the QR codes (``?qr=1``). The archive is streamed as it is built."""
+    event = get_object_or_404(WeddingEvent, id=event_id, planner__user=request.user)
+    include_qr = request.GET.get("qr") in ("1", "true", "yes")
+
+    guests = (
+        Guest.objects.filter(invitation__event=event)
+        .exclude(card_image="")
+        .exclude(card_image__isnull=True)
+        .only("id", "first_name", "card_image", "qr_code")
+        .order_by("first_name", "id")
+        .iterator(chunk_size=200)
+    )
+
+    response = StreamingHttpResponse(
+        iter_zip(_guest_export_entries(guests, include_qr)),
+        content_type="application/zip",
+    )
+    file_name = slugify(event.title) or "event"
+    response["Content-Disposition"] = f'attachment; filename="{file_name}-cards.zip"'
+    return response
+
+
 def verify_invitation(request, guest_id):
     guest = get_object_or_404(Guest, id=guest_id)
+    return _check_in(request, guest)
+
+
+def verify_token(request, token):
+    """Check a guest in from the signed token on their QR code.
+
+    Malformed, forged and expired tokens are turned away before any
+    database query is made.
+    """
+    try:
+        verified = read_token(token)
+    except ExpiredToken:
+        return render(
+            request,
+            "invitations/token_rejected.html",
+            {"message": "This invitation has expired."},
+            status=410,
+        )
+    except InvalidToken:
+        return render(
+            request,
+            "invitations/token_rejected.html",
+            {"message": "This invitation could not be verified."},
+            status=403,
+        )
+
+    guest = get_object_or_404(
+        Guest.objects.select_related("invitation__event"), id=verified.guest_id
+    )
+    if event_tag(guest.invitation.event_id) != verified.event_tag:
+        return render(
+            request,
+            "invitations/token_rejected.html",
+            {"message": "This invitation could not be verified."},
+            status=403,
+        )
+    return _check_in(request, guest)
+
+
+def _check_in(request, guest):
     event = guest.invitation.event  # Get the related event
 
-    # Check if already verified
-    if QRVerification.objects.filter(guest=guest).exists():
+    if not check_in_guest(guest):
         return render(
             request,
             "invitations/verification_failed.html",
@@ -258,16 +397,6 @@ def verify_invitation(request, guest_id):
             },
         )
 
-    # Create verification and update check-in status
-    QRVerification.objects.create(
-        guest=guest,
-        is_valid=True,
-        scanned_at=now(),
-    )
-    guest.checked_in = True
-    guest.check_in_time = now()
-    guest.save()
-
     return render(
         request,
         "invitations/verification_success.html",
@@ -280,7 +409,13 @@ def verify_invitation(request, guest_id):
 
 
 def invitation_card_view(request, pk):
-    invitation = get_object_or_404(Guest, pk=pk)
+    # No ETag here: the page carries the visitor's nav and flash messages.
+    # Conditional requests belong on the card image itself.
+    invitation = get_object_or_404(
+        Guest.objects.select_related("invitation__event"), pk=pk
+    )
+    if card_render_mode() == "lazy":
+        invitation = ensure_guest_card(invitation)
 
     return render(
         request, "invitations/invitation_card.html", {"invitation": invitation}
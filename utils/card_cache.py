@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _pack(files):
+    """Serialize ``{name: (file_name, content)}`` as a JSON header line
+    followed by the concatenated file contents."""
+    header = [[name, file_name, len(content)] for name, (file_name, content) in files.items()]
+    return json.dumps(header).encode("utf-8") + b"\n" + b"".join(
+        content for _, content in files.values()
+    )
+
+
+def _unpack(blob):
+    header, _, body = blob.partition(b"\n")
+    files = {}
+    offset = 0
+    for name, file_name, length in json.loads(header):
+        files[name] = (file_name, body[offset:offset + length])
+        offset += length
+    return files
+
+
+class BaseCardCache:
+    """Rendered card files keyed by the fingerprint of their render inputs.
+
+    Entries map a name (``"card"``, ``"thumbnail"``, ...) to a
+    ``(file_name, content)`` pair. Once the stored bytes exceed
+    ``max_bytes`` the least recently used entries are evicted.
+    """
+
+    def __init__(self, location, max_bytes):
+        self.location = location
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        blob = self._read(key)
+        if blob is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _unpack(blob)
+
+    def set(self, key, files):
+        self._write(key, _pack(files))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _read(self, key):
+        raise NotImplementedError
+
+    def _write(self, key, blob):
+        raise NotImplementedError
+
+
+class FileSystemCardCache(BaseCardCache):
+    """One file per entry; the modification time doubles as the LRU clock."""
+
+    def __init__(self, location, max_bytes):
+        super().__init__(location, max_bytes)
+        os.makedirs(location, exist_ok=True)
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.location, key[:2], f"{key}.card")
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as entry:
+                blob = entry.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return blob
+
+    def _write(self, key, blob):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a temporary name so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as entry:
+            entry.write(blob)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += len(blob)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for directory, _, file_names in os.walk(self.location):
+            for file_name in file_names:
+                if not file_name.endswith(".card"):
+                    continue
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Trim to 90% of the budget so eviction doesn't run on every write
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+
+class RedisCardCache(BaseCardCache):
+    """Entries live under ``<prefix>:entry:<key>``; a sorted set scored by
+    last access time orders them for eviction."""
+
+    prefix = "cardcache"
+
+    def __init__(self, location, max_bytes):
+        super().__init__(location, max_bytes)
+        import redis
+
+        self.client = redis.Redis.from_url(location)
+        self.lru_key = f"{self.prefix}:lru"
+        self.sizes_key = f"{self.prefix}:sizes"
+        self.total_key = f"{self.prefix}:bytes"
+
+    def _entry_key(self, key):
+        return f"{self.prefix}:entry:{key}"
+
+    def _read(self, key):
+        blob = self.client.get(self._entry_key(key))
+        if blob is not None:
+            self.client.zadd(self.lru_key, {key: time.time()})
+        return blob
+
+    def _write(self, key, blob):
+        previous = self.client.hget(self.sizes_key, key)
+        pipe = self.client.pipeline()
+        pipe.set(self._entry_key(key), blob)
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.hset(self.sizes_key, key, len(blob))
+        pipe.incrby(self.total_key, len(blob) - int(previous or 0))
+        total = pipe.execute()[-1]
+        if total > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        while int(self.client.get(self.total_key) or 0) > target:
+            oldest = self.client.zpopmin(self.lru_key)
+            if not oldest:
+                break
+            key = oldest[0][0].decode("utf-8")
+            size = int(self.client.hget(self.sizes_key, key) or 0)
+            pipe = self.client.pipeline()
+            pipe.delete(self._entry_key(key))
+            pipe.hdel(self.sizes_key, key)
+            pipe.decrby(self.total_key, size)
+            pipe.execute()
+
+
+CARD_CACHE_BACKENDS = {
+    "filesystem": FileSystemCardCache,
+    "redis": RedisCardCache,
+}
+
+
+def get_card_cache():
+    """Return the process-wide card cache configured by ``CARD_CACHE``, or
+    None when caching is disabled."""
+    global _cache
+    config = getattr(settings, "CARD_CACHE", None) or {}
+    backend = config.get("BACKEND")
+    if not backend:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CARD_CACHE_BACKENDS[backend](
+                    config["LOCATION"], config.get("MAX_BYTES", 256 * 1024 * 1024)
+                )
+    return _cache
+
+
+@receiver(setting_changed)
+def _reset_cache(setting, **kwargs):
+    global _cache
+    if setting == "CARD_CACHE":
+        _cache = None
@@ -0,0 +1,71 @@
+import logging
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+# Added to an archive listing the files that couldn't be read into it
+MISSING_FILES_NAME = "MISSING.txt"
+
+
+class _ZipSink:
+    """Write-only, unseekable target for ``zipfile``.
+
+    Written bytes are held only until the next ``drain()``, so the archive
+    can be streamed while it is being built. As the sink cannot seek,
+    ``zipfile`` writes sizes and CRCs in data descriptors after each entry.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a ZIP archive of ``entries`` piece by piece.
+
+    ``entries`` is an iterable of ``(arcname, field_file)`` pairs; each file
+    is read through its own storage (local or S3) ``chunk_size`` bytes at a
+    time, so memory use doesn't grow with the number or size of files.
+    Images are already compressed, so entries are stored as-is.
+
+    The response is already under way by the time a file turns out to be
+    missing or unreadable, so it can't fail the request instead. A file
+    that can't be opened is left out; one that fails partway is closed
+    where it broke, keeping the archive itself valid. Either way it is
+    logged and listed in a ``MISSING.txt`` entry at the end.
+    """
+    sink = _ZipSink()
+    missing = []
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, field_file in entries:
+            try:
+                source = field_file.storage.open(field_file.name, "rb")
+            except Exception:
+                logger.exception("Leaving %s out of the export", field_file.name)
+                missing.append(f"{arcname}: missing")
+                continue
+            with source, archive.open(arcname, "w") as target:
+                try:
+                    for chunk in source.chunks(chunk_size):
+                        target.write(chunk)
+                        yield sink.drain()
+                except Exception:
+                    logger.exception("Export of %s cut short", field_file.name)
+                    missing.append(f"{arcname}: incomplete")
+            yield sink.drain()
+        if missing:
+            archive.writestr(MISSING_FILES_NAME, "\n".join(missing) + "\n")
+    # Central directory
+    yield sink.drain()
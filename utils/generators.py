@@ -1,28 +1,419 @@
 from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
+from collections import OrderedDict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import lru_cache
+from types import SimpleNamespace
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.conf import settings
+from django.urls import reverse
+import hashlib
+import logging
 import os
 import math
+import multiprocessing
+import threading
+import time
 
+import qrcode
 
-def generate_wedding_card(event, invitation=None, qr_image=None, invitee_name=None, events=None, payment_amount=None):
-    card_size = (600, 900)  
+from utils.card_cache import get_card_cache
+from utils.tokens import token_verify_url
 
-    background_gradient_start = (252, 250, 248)  
-    background_gradient_end = (248, 242, 235)  
-    primary_text_color = (60, 50, 45)  # Dark brown
-    accent_color = (170, 120, 70)  # Gold
-    secondary_text_color = (100, 85, 75)  # Medium brown
-    border_color = (190, 160, 120)  # Gold border
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the ImageDraw path is the fallback
+    np = None
 
-    # Create base image and drawer
-    image = Image.new("RGB", card_size, color=background_gradient_start)
+logger = logging.getLogger(__name__)
+
+
+CARD_SIZE = (600, 900)
+
+CARD_THEMES = {
+    "classic": {
+        "background_gradient_start": (252, 250, 248),
+        "background_gradient_end": (248, 242, 235),
+        "primary_text_color": (60, 50, 45),  # Dark brown
+        "accent_color": (170, 120, 70),  # Gold
+        "secondary_text_color": (100, 85, 75),  # Medium brown
+        "border_color": (190, 160, 120),  # Gold border
+    },
+}
+
+DEFAULT_THEME = "classic"
+
+SEPARATOR_LENGTH = 200
+DIAMOND_SIZE = 5
+
+QR_SIZE = 80
+QR_MARGIN = 50
+QR_PADDING = 8
+# Quiet zone, in modules, around stored QR codes. On cards the white frame
+# around the code provides it.
+QR_BORDER = 4
+
+QR_ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# CARD_SIZE and every layout coordinate are in pixels at BASE_DPI; higher
+# resolutions scale them. From CARD_TILE_DPI up, cards are drawn in
+# horizontal bands of CARD_TILE_HEIGHT pixels.
+BASE_DPI = 100
+CARD_TILE_DPI = 300
+CARD_TILE_HEIGHT = 512
+CARD_TILE_OVERLAP = 8
+
+RASTER_BACKENDS = ("numpy", "pil")
+
+# Bump whenever the drawing code changes what a card looks like, so cached
+# cards and ETags derived from the render inputs are invalidated
+CARD_RENDER_VERSION = 2
+
+# Output encodings for rendered cards. "png" is the original optimized PNG;
+# the others trade encode CPU against the bytes stored and sent.
+CARD_FORMATS = {
+    "png": {
+        "label": "PNG (optimized)",
+        "format": "PNG",
+        "extension": "png",
+        "content_type": "image/png",
+        "options": {"optimize": True},
+    },
+    "png-fast": {
+        "label": "PNG (fast)",
+        "format": "PNG",
+        "extension": "png",
+        "content_type": "image/png",
+        "options": {"compress_level": 1},
+    },
+    "png-quantized": {
+        "label": "PNG (palette)",
+        "format": "PNG",
+        "extension": "png",
+        "content_type": "image/png",
+        "options": {},
+        "quantize": True,
+    },
+    "webp": {
+        "label": "WebP",
+        "format": "WEBP",
+        "extension": "webp",
+        "content_type": "image/webp",
+        "options": {"quality": 85, "method": 4},
+    },
+    "jpeg": {
+        "label": "JPEG (progressive)",
+        "format": "JPEG",
+        "extension": "jpg",
+        "content_type": "image/jpeg",
+        "options": {"quality": 90, "progressive": True, "optimize": True},
+    },
+}
+
+# Downscaled copies stored next to each full-size card, as (width, height)
+CARD_DERIVATIVES = {
+    "thumbnail": (100, 150),
+    "preview": (300, 450),
+}
+
+# Fonts scaled down for portrait, as (font file, size)
+TITLE_FONT = ("GreatVibes-Regular.ttf", 40)
+SUBTITLE_FONT = ("Poppins-Light.ttf", 16)
+BODY_FONT = ("Poppins-Regular.ttf", 14)
+ACCENT_FONT = ("Poppins-Medium.ttf", 12)
+SMALL_FONT = ("Poppins-Regular.ttf", 10)
+
+CARD_FONTS = (TITLE_FONT, SUBTITLE_FONT, BODY_FONT, ACCENT_FONT, SMALL_FONT)
+
+# Per-format encode counters for this process, see encoder_stats()
+_encoder_stats = {}
+
+# Pre-rendered layers shared by every card drawn in this process
+_background_cache = {}
+_separator_cache = {}
+
+# Parsed fonts keyed by (font file, size), plus the raw font files they
+# were parsed from so further sizes never go back to disk
+_font_registry = {}
+_font_files = {}
+_font_stats = {"hits": 0, "misses": 0}
+
+
+def _font_search_paths(font_name):
+    return [
+        os.path.join(settings.BASE_DIR, "static", "fonts", font_name),
+        f"/System/Library/Fonts/{font_name}",
+        f"C:/Windows/Fonts/{font_name}",
+    ]
+
+
+def _read_font_file(font_name):
+    if font_name not in _font_files:
+        data = None
+        for font_path in _font_search_paths(font_name):
+            try:
+                with open(font_path, "rb") as font_file:
+                    data = font_file.read()
+                break
+            except OSError:
+                continue
+        _font_files[font_name] = data
+    return _font_files[font_name]
+
+
+def get_font(font_name, size):
+    """Return the parsed font for ``(font_name, size)`` from the registry,
+    loading it on first use. Falls back to Pillow's default font when the
+    file can't be found anywhere."""
+    key = (font_name, size)
+    font = _font_registry.get(key)
+    if font is not None:
+        _font_stats["hits"] += 1
+        return font
+
+    _font_stats["misses"] += 1
+    data = _read_font_file(font_name)
+    try:
+        font = ImageFont.truetype(BytesIO(data), size) if data else None
+    except OSError:
+        font = None
+    if font is None:
+        font = ImageFont.load_default()
+    _font_registry[key] = font
+    return font
+
+
+def warmup_fonts(fonts=CARD_FONTS):
+    """Load every card font into the registry.
+
+    Call this before forking (gunicorn ``--preload``, celery ``worker_init``)
+    so worker processes share the parsed faces copy-on-write.
+    """
+    for font_name, size in fonts:
+        get_font(font_name, size)
+
+
+def font_registry_stats():
+    return {
+        "hits": _font_stats["hits"],
+        "misses": _font_stats["misses"],
+        "fonts": len(_font_registry),
+    }
+
+
+def _draw_flourish(draw, x, y, color, size=20, scale=1, top=0):
+    # Snap to whole pixels before shifting by ``top`` so every band of a
+    # tiled card rounds the same way
+    for i in range(0, 360, 10):
+        angle = math.radians(i)
+        radius = size * (1 - i / 360) * 0.5
+        x1 = x + radius * math.cos(angle)
+        y1 = y + radius * math.sin(angle)
+        x2 = x + (radius + 2 * scale) * math.cos(angle + 0.1)
+        y2 = y + (radius + 2 * scale) * math.sin(angle + 0.1)
+        draw.line(
+            [
+                (math.floor(x1), math.floor(y1) - top),
+                (math.floor(x2), math.floor(y2) - top),
+            ],
+            fill=color,
+            width=max(1, round(scale)),
+        )
+
+
+def _flourish_segments(x, y, size=20):
+    """Endpoints of the short strokes making up a flourish, one row per stroke."""
+    angles = np.radians(np.arange(0, 360, 10))
+    radius = size * (1 - np.arange(0, 360, 10) / 360) * 0.5
+    return np.stack(
+        [
+            x + radius * np.cos(angles),
+            y + radius * np.sin(angles),
+            x + (radius + 2) * np.cos(angles + 0.1),
+            y + (radius + 2) * np.sin(angles + 0.1),
+        ],
+        axis=1,
+    )
+
+
+def _stamp(pixels, xs, ys, color):
+    """Set every (x, y) point inside the array to ``color``."""
+    xs = np.rint(xs).astype(np.intp)
+    ys = np.rint(ys).astype(np.intp)
+    inside = (xs >= 0) & (xs < pixels.shape[1]) & (ys >= 0) & (ys < pixels.shape[0])
+    pixels[ys[inside], xs[inside]] = color
+
+
+def _stamp_segments(pixels, segments, color):
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    steps = int(np.ceil(lengths.max())) * 2 + 1
+    t = np.linspace(0.0, 1.0, steps)[None, :]
+    xs = segments[:, 0:1] + (segments[:, 2:3] - segments[:, 0:1]) * t
+    ys = segments[:, 1:2] + (segments[:, 3:4] - segments[:, 1:2]) * t
+    _stamp(pixels, xs.ravel(), ys.ravel(), color)
+
+
+def _stamp_arcs(pixels, arcs, color):
+    """Stamp quarter arcs given as rows of (cx, cy, radius, start_degrees)."""
+    arcs = np.asarray(arcs, dtype=float)
+    steps = int(np.ceil(arcs[:, 2].max() * math.pi)) + 1
+    angles = np.radians(arcs[:, 3:4] + np.linspace(0.0, 90.0, steps)[None, :])
+    xs = arcs[:, 0:1] + arcs[:, 2:3] * np.cos(angles)
+    ys = arcs[:, 1:2] + arcs[:, 2:3] * np.sin(angles)
+    _stamp(pixels, xs.ravel(), ys.ravel(), color)
+
+
+def _outline(pixels, box, color, width):
+    x0, y0, x1, y1 = box
+    pixels[y0:y0 + width, x0:x1 + 1] = color
+    pixels[y1 - width + 1:y1 + 1, x0:x1 + 1] = color
+    pixels[y0:y1 + 1, x0:x0 + width] = color
+    pixels[y0:y1 + 1, x1 - width + 1:x1 + 1] = color
+
+
+def _render_card_background_numpy(card_size, theme):
+    """Array-based equivalent of ``_render_card_background``.
+
+    The gradient and every decoration are written into a single pixel array
+    which is handed to Pillow in one ``Image.fromarray`` call.
+    """
+    width, height = card_size
+    start = np.array(theme["background_gradient_start"], dtype=float)
+    end = np.array(theme["background_gradient_end"], dtype=float)
+    accent_color = theme["accent_color"]
+
+    # Gradient background, one colour per row broadcast across the width
+    ratio = (np.arange(height) / height)[:, None]
+    rows = (start * (1 - ratio) + end * ratio).astype(np.uint8)
+    pixels = np.repeat(rows[:, None, :], width, axis=1)
+
+    # Borders
+    border_margin = 30
+    inner_margin = border_margin + 15
+    _outline(
+        pixels,
+        (border_margin, border_margin, width - border_margin, height - border_margin),
+        theme["border_color"],
+        3,
+    )
+    _outline(
+        pixels,
+        (inner_margin, inner_margin, width - inner_margin, height - inner_margin),
+        accent_color,
+        1,
+    )
+
+    # Flourishes at top left and right
+    segments = np.concatenate(
+        [
+            _flourish_segments(width // 2 - 100, 100, 20),
+            _flourish_segments(width // 2 + 100, 100, 20),
+        ]
+    )
+    _stamp_segments(pixels, segments, accent_color)
+
+    # Corner flourishes
+    corner_size = 20
+    margin = 40
+    corners = [
+        (margin, margin, 180),
+        (width - margin, margin, 270),
+        (margin, height - margin, 90),
+        (width - margin, height - margin, 0),
+    ]
+    arcs = [
+        (cx, cy, corner_size - i * 7, start_angle)
+        for cx, cy, start_angle in corners
+        for i in range(3)
+    ]
+    _stamp_arcs(pixels, arcs, accent_color)
+
+    return Image.fromarray(pixels, "RGB")
+
+
+def _render_separator_numpy(theme):
+    size = (SEPARATOR_LENGTH + DIAMOND_SIZE * 2 + 1, DIAMOND_SIZE * 2 + 1)
+    pixels = np.zeros((size[1], size[0], 4), dtype=np.uint8)
+
+    pixels[DIAMOND_SIZE, DIAMOND_SIZE:DIAMOND_SIZE + SEPARATOR_LENGTH + 1] = (
+        *theme["border_color"],
+        255,
+    )
+
+    ys, xs = np.mgrid[0:size[1], 0:size[0]]
+    centers = DIAMOND_SIZE + (SEPARATOR_LENGTH // 4) * np.arange(5)
+    distance = np.abs(xs[None] - centers[:, None, None]) + np.abs(ys[None] - DIAMOND_SIZE)
+    pixels[(distance <= DIAMOND_SIZE).any(axis=0)] = (*theme["accent_color"], 255)
+
+    return Image.fromarray(pixels, "RGBA")
+
+
+def get_raster_backend(raster=None):
+    """Resolve the rasterizer for static layers.
+
+    ``raster`` overrides the ``CARD_RASTER_BACKEND`` setting, which lets the
+    two implementations be benchmarked side by side. Falls back to ``"pil"``
+    when NumPy, an optional dependency, isn't installed.
+    """
+    raster = raster or getattr(settings, "CARD_RASTER_BACKEND", "pil")
+    if raster not in RASTER_BACKENDS:
+        raise ValueError(f"Unknown raster backend: {raster}")
+    if raster == "numpy" and np is None:
+        _warn_numpy_missing()
+        return "pil"
+    return raster
+
+
+@lru_cache(maxsize=None)
+def _warn_numpy_missing():
+    logger.warning('CARD_RASTER_BACKEND is "numpy", but NumPy is not installed; using "pil"')
+
+
+def render_card_background(card_size=CARD_SIZE, theme=DEFAULT_THEME, raster=None):
+    """Build a fresh, uncached background layer."""
+    if get_raster_backend(raster) == "numpy":
+        return _render_card_background_numpy(card_size, CARD_THEMES[theme])
+    return _render_card_background(card_size, CARD_THEMES[theme])
+
+
+def _render_card_background(card_size, theme, scale=1, top=0, height=None):
+    """Paint the guest-independent parts of a card: gradient, borders,
+    top flourishes and corner arcs.
+
+    ``card_size`` is in BASE_DPI pixels and drawn ``scale`` times larger.
+    ``top`` and ``height`` select a horizontal band of the scaled card, so
+    high-resolution cards can be painted a tile at a time.
+    """
+    background_gradient_start = theme["background_gradient_start"]
+    background_gradient_end = theme["background_gradient_end"]
+    accent_color = theme["accent_color"]
+    border_color = theme["border_color"]
+
+    width = round(card_size[0] * scale)
+    full_height = round(card_size[1] * scale)
+    if height is None:
+        height = full_height - top
+
+    def box(x0, y0, x1, y1):
+        return [
+            math.floor(x0 * scale),
+            math.floor(y0 * scale) - top,
+            math.floor(x1 * scale),
+            math.floor(y1 * scale) - top,
+        ]
+
+    image = Image.new("RGB", (width, height), color=background_gradient_start)
     draw = ImageDraw.Draw(image)
 
     # Gradient background
-    for y in range(card_size[1]):
-        ratio = y / card_size[1]
+    for y in range(top, top + height):
+        ratio = y / full_height
         r = int(
             background_gradient_start[0] * (1 - ratio)
             + background_gradient_end[0] * ratio
@@ -35,394 +426,1128 @@ def generate_wedding_card(event, invitation=None, qr_image=None, invitee_name=No
             background_gradient_start[2] * (1 - ratio)
             + background_gradient_end[2] * ratio
         )
-        draw.line([(0, y), (card_size[0], y)], fill=(r, g, b))
+        draw.line([(0, y - top), (width, y - top)], fill=(r, g, b))
 
     # Borders
     border_margin = 30
     border_width = 3
 
     draw.rectangle(
-        [
+        box(
             border_margin,
             border_margin,
             card_size[0] - border_margin,
             card_size[1] - border_margin,
-        ],
+        ),
         outline=border_color,
-        width=border_width,
+        width=max(1, round(border_width * scale)),
     )
 
     inner_margin = border_margin + 15
     draw.rectangle(
-        [
+        box(
             inner_margin,
             inner_margin,
             card_size[0] - inner_margin,
             card_size[1] - inner_margin,
-        ],
+        ),
         outline=accent_color,
-        width=1,
+        width=max(1, round(scale)),
     )
 
-    # Load fonts helper
-    def load_font(font_name, size):
-        font_paths = [
-            os.path.join(settings.BASE_DIR, "static", "fonts", font_name),
-            f"/System/Library/Fonts/{font_name}",
-            f"C:/Windows/Fonts/{font_name}",
+    # Flourishes at top left and right
+    for flourish_x in (card_size[0] // 2 - 100, card_size[0] // 2 + 100):
+        _draw_flourish(
+            draw, flourish_x * scale, 100 * scale, accent_color, 20 * scale, scale, top
+        )
+
+    # Corner flourishes: top-left, top-right, bottom-left, bottom-right
+    corner_size = 20
+    margin = 40
+    corners = [
+        (margin, margin, 180, 270),
+        (card_size[0] - margin, margin, 270, 360),
+        (margin, card_size[1] - margin, 90, 180),
+        (card_size[0] - margin, card_size[1] - margin, 0, 90),
+    ]
+    for cx, cy, start, end in corners:
+        for i in range(3):
+            draw.arc(
+                box(
+                    cx - corner_size + i * 7,
+                    cy - corner_size + i * 7,
+                    cx + corner_size - i * 7,
+                    cy + corner_size - i * 7,
+                ),
+                start,
+                end,
+                fill=accent_color,
+                width=max(1, round(scale)),
+            )
+
+    return image
+
+
+def _render_separator(theme, scale=1):
+    """Separator line with diamonds on a transparent sprite. The sprite's
+    origin sits DIAMOND_SIZE pixels above and left of the line start."""
+    diamond_size = round(DIAMOND_SIZE * scale)
+    length = round(SEPARATOR_LENGTH * scale)
+    size = (length + diamond_size * 2 + 1, diamond_size * 2 + 1)
+    sprite = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(sprite)
+
+    line_y = diamond_size
+    draw.line(
+        [(diamond_size, line_y), (diamond_size + length, line_y)],
+        fill=theme["border_color"],
+        width=max(1, round(scale)),
+    )
+    for i in range(5):
+        diamond_x = diamond_size + (length // 4) * i
+        diamond_points = [
+            (diamond_x, line_y - diamond_size),
+            (diamond_x + diamond_size, line_y),
+            (diamond_x, line_y + diamond_size),
+            (diamond_x - diamond_size, line_y),
         ]
-        for font_path in font_paths:
-            try:
-                if os.path.exists(font_path):
-                    return ImageFont.truetype(font_path, size)
-            except:
-                continue
-        return ImageFont.load_default()
-
-    # Fonts scaled down for portrait
-    title_font = load_font("GreatVibes-Regular.ttf", 40)
-    subtitle_font = load_font("Poppins-Light.ttf", 16)
-    body_font = load_font("Poppins-Regular.ttf", 14)
-    accent_font = load_font("Poppins-Medium.ttf", 12)
-    small_font = load_font("Poppins-Regular.ttf", 10)
-
-    # Decorative flourishes function
-    def draw_flourish(x, y, size=20):
-        for i in range(0, 360, 10):
-            angle = math.radians(i)
-            radius = size * (1 - i / 360) * 0.5
-            x1 = x + radius * math.cos(angle)
-            y1 = y + radius * math.sin(angle)
-            x2 = x + (radius + 2) * math.cos(angle + 0.1)
-            y2 = y + (radius + 2) * math.sin(angle + 0.1)
-            draw.line([(x1, y1), (x2, y2)], fill=accent_color, width=1)
+        draw.polygon(diamond_points, fill=theme["accent_color"])
+    return sprite
 
-    # Flourishes at top left and right
-    draw_flourish(card_size[0] // 2 - 100, 100, 20)
-    draw_flourish(card_size[0] // 2 + 100, 100, 20)
 
-    # Invitation text centered
-    invitation_text = "You're Cordially Invited"
-    bbox = draw.textbbox((0, 0), invitation_text, font=subtitle_font)
-    x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-    draw.text(
-        (x_pos, 130), invitation_text, fill=secondary_text_color, font=subtitle_font
+def get_card_background(card_size=CARD_SIZE, theme=DEFAULT_THEME, raster=None):
+    """Return the background layer for ``card_size`` and ``theme``.
+
+    Built once per process; the image is shared, so callers must ``copy()``
+    it before drawing on it.
+    """
+    raster = get_raster_backend(raster)
+    key = (tuple(card_size), theme, raster)
+    background = _background_cache.get(key)
+    if background is None:
+        background = render_card_background(card_size, theme, raster)
+        _background_cache[key] = background
+    return background
+
+
+def get_separator_sprite(theme=DEFAULT_THEME, raster=None, scale=1):
+    raster = get_raster_backend(raster)
+    key = (theme, raster, scale)
+    sprite = _separator_cache.get(key)
+    if sprite is None:
+        if raster == "numpy" and scale == 1:
+            sprite = _render_separator_numpy(CARD_THEMES[theme])
+        else:
+            sprite = _render_separator(CARD_THEMES[theme], scale)
+        _separator_cache[key] = sprite
+    return sprite
+
+
+def get_card_format(card_format=None):
+    """Resolve the encoder for a card: an explicit (per-event) format wins,
+    then the ``CARD_FORMAT`` setting, then optimized PNG."""
+    card_format = card_format or getattr(settings, "CARD_FORMAT", "png")
+    if card_format not in CARD_FORMATS:
+        raise ValueError(f"Unknown card format: {card_format}")
+    return card_format
+
+
+def encode_card(image, card_format=None):
+    """Encode a rendered card, returning ``(buffer, card_format)``.
+
+    Output size and encode time are recorded per format.
+    """
+    card_format = get_card_format(card_format)
+    encoder = CARD_FORMATS[card_format]
+
+    started = time.perf_counter()
+    if encoder.get("quantize"):
+        image = image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    buffer = BytesIO()
+    image.save(buffer, format=encoder["format"], **encoder["options"])
+    elapsed = time.perf_counter() - started
+    buffer.seek(0)
+
+    size = buffer.getbuffer().nbytes
+    stats = _encoder_stats.setdefault(card_format, {"count": 0, "bytes": 0, "seconds": 0.0})
+    stats["count"] += 1
+    stats["bytes"] += size
+    stats["seconds"] += elapsed
+    logger.debug("Encoded %s card: %s bytes in %.1f ms", card_format, size, elapsed * 1000)
+    return buffer, card_format
+
+
+def encoder_stats(reset=False):
+    """Totals and averages per card format encoded by this process, e.g.
+    for ``benchmark_cards``. ``reset`` starts the counts over."""
+    stats = {
+        card_format: {
+            **stats,
+            "avg_bytes": stats["bytes"] / stats["count"],
+            "avg_ms": stats["seconds"] * 1000 / stats["count"],
+        }
+        for card_format, stats in _encoder_stats.items()
+    }
+    if reset:
+        _encoder_stats.clear()
+    return stats
+
+
+CardLayout = namedtuple("CardLayout", ["head", "body", "body_height", "tail"])
+CardLayout.__doc__ = """Event-level draw plan for a card.
+
+``head`` ops use absolute positions. ``body`` ops are relative to the line
+under the (optional) invitee name and span ``body_height`` pixels; ``tail``
+ops are relative to the end of the (optional) payment block. Each op is a
+tuple whose first item names the primitive: ``("text", xy, text, font, fill)``,
+``("line", points, fill, width)``, ``("ellipse", box, fill)`` or
+``("separator", xy)``.
+"""
+
+LAYOUT_CACHE_SIZE = 256
+
+_layout_cache = OrderedDict()
+_measure_draw = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+
+@lru_cache(maxsize=4096)
+def measure_text(text, font_name, size):
+    """Width of ``text`` in the given font, memoized across cards."""
+    bbox = _measure_draw.textbbox((0, 0), text, font=get_font(font_name, size))
+    return bbox[2] - bbox[0]
+
+
+def _centered_text(y, text, font, fill, card_size=CARD_SIZE):
+    x_pos = (card_size[0] - measure_text(text, *font)) // 2
+    return ("text", (x_pos, y), text, font, fill)
+
+
+def event_layout_key(event, events=None, theme=DEFAULT_THEME, has_qr=True):
+    """Identify an event layout version from the fields that are drawn."""
+    return (
+        str(getattr(event, "id", "")),
+        event.title,
+        getattr(event, "couple", None),
+        event.date,
+        event.venue,
+        getattr(event, "rsvp_info", None),
+        tuple(
+            (evt.get("name"), evt.get("date"), evt.get("time"), evt.get("location"))
+            for evt in events or ()
+        ),
+        theme,
+        has_qr,
     )
 
-    # Add invitee name if provided
-    current_y = 160
-    if invitee_name:
-        invitee_text = f"Dear {invitee_name},"
-        bbox = draw.textbbox((0, 0), invitee_text, font=accent_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, current_y), invitee_text, fill=accent_color, font=accent_font)
-        current_y += 25
 
-    # Decorative line under invitation text
-    line_y = current_y
+def event_fingerprint(event, events=None, theme=DEFAULT_THEME, card_format=None):
+    """Hash of the render inputs shared by every card of an event."""
+    inputs = (
+        CARD_RENDER_VERSION,
+        event_layout_key(event, events, theme),
+        get_card_format(card_format),
+    )
+    return hashlib.sha256(repr(inputs).encode("utf-8")).hexdigest()
+
+
+def card_fingerprint(event, events=None, invitee_name=None, payment_amount=None, qr_payload=None, theme=DEFAULT_THEME, card_format=None):
+    """Hash of everything that determines a card's bytes."""
+    inputs = (
+        CARD_RENDER_VERSION,
+        event_layout_key(event, events, theme, has_qr=bool(qr_payload)),
+        invitee_name,
+        payment_amount,
+        qr_payload,
+        get_qr_error_correction() if qr_payload else None,
+        get_card_format(card_format),
+    )
+    return hashlib.sha256(repr(inputs).encode("utf-8")).hexdigest()
+
+
+def build_event_layout(event, events=None, theme=DEFAULT_THEME, has_qr=True):
+    """Lay out everything on a card that is the same for every guest."""
+    card_size = CARD_SIZE
+    palette = CARD_THEMES[theme]
+
+    primary_text_color = palette["primary_text_color"]
+    accent_color = palette["accent_color"]
+    secondary_text_color = palette["secondary_text_color"]
+
+    title_font = TITLE_FONT
+    subtitle_font = SUBTITLE_FONT
+    body_font = BODY_FONT
+    accent_font = ACCENT_FONT
+    small_font = SMALL_FONT
+
+    # Invitation text centered
+    head = [
+        _centered_text(
+            130, "You're Cordially Invited", subtitle_font, secondary_text_color
+        )
+    ]
+
+    # Decorative line under invitation text (the invitee name, if any,
+    # sits above it, so the body is laid out relative to this line)
+    body = []
     line_length = 150
     line_x = (card_size[0] - line_length) // 2
-    draw.line(
-        [(line_x, line_y), (line_x + line_length, line_y)], fill=accent_color, width=2
-    )
+    body.append(("line", [(line_x, 0), (line_x + line_length, 0)], accent_color, 2))
 
     # Event title centered
-    event_title = f"The {event.title}"
-    bbox = draw.textbbox((0, 0), event_title, font=title_font)
-    x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-    title_y = line_y + 20
-    draw.text((x_pos, title_y), event_title, fill=primary_text_color, font=title_font)
+    title_y = 20
+    body.append(_centered_text(title_y, f"The {event.title}", title_font, primary_text_color))
 
     # Couple's names (if available)
     current_y = title_y + 50
     if hasattr(event, 'couple') and event.couple:
-        couple_text = event.couple
-        bbox = draw.textbbox((0, 0), couple_text, font=subtitle_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, current_y), couple_text, fill=accent_color, font=subtitle_font)
+        body.append(_centered_text(current_y, event.couple, subtitle_font, accent_color))
         current_y += 40
-    
+
     decorative_y = current_y
 
     # Decorative ellipses around title/couple area
-    draw.ellipse(
+    body.append((
+        "ellipse",
         [card_size[0] // 2 - 90, decorative_y, card_size[0] // 2 - 85, decorative_y + 5],
-        fill=accent_color,
-    )
-    draw.ellipse(
+        accent_color,
+    ))
+    body.append((
+        "ellipse",
         [card_size[0] // 2 + 85, decorative_y, card_size[0] // 2 + 90, decorative_y + 5],
-        fill=accent_color,
-    )
+        accent_color,
+    ))
 
     # Multiple events or single event
     events_y = decorative_y + 30
     if events and len(events) > 1:
-        # Multiple events
         for i, evt in enumerate(events):
             # Event name/label
             event_name = evt.get('name', f'Event {i + 1}')
-            bbox = draw.textbbox((0, 0), event_name, font=accent_font)
-            x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-            draw.text((x_pos, events_y), event_name, fill=accent_color, font=accent_font)
+            body.append(_centered_text(events_y, event_name, accent_font, accent_color))
             events_y += 20
-            
+
             # Date and time
             date_str = evt.get('date', 'TBD')
             time_str = evt.get('time', 'TBD')
-            
-            bbox = draw.textbbox((0, 0), date_str, font=body_font)
-            x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-            draw.text((x_pos, events_y), date_str, fill=primary_text_color, font=body_font)
+
+            body.append(_centered_text(events_y, date_str, body_font, primary_text_color))
             events_y += 20
-            
-            bbox = draw.textbbox((0, 0), time_str, font=accent_font)
-            x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-            draw.text((x_pos, events_y), time_str, fill=secondary_text_color, font=accent_font)
+
+            body.append(_centered_text(events_y, time_str, accent_font, secondary_text_color))
             events_y += 20
-            
+
             # Location
             location = evt.get('location', 'TBD')
-            venue_label = "AT"
-            bbox = draw.textbbox((0, 0), venue_label, font=accent_font)
-            x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-            draw.text((x_pos, events_y), venue_label, fill=secondary_text_color, font=accent_font)
+            body.append(_centered_text(events_y, "AT", accent_font, secondary_text_color))
             events_y += 15
-            
-            bbox = draw.textbbox((0, 0), location, font=body_font)
-            x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-            draw.text((x_pos, events_y), location, fill=primary_text_color, font=body_font)
+
+            body.append(_centered_text(events_y, location, body_font, primary_text_color))
             events_y += 30
     else:
         # Single event (original behavior)
         date_str = event.date.strftime("%A, %B %d, %Y")
         time_str = event.date.strftime("%I:%M %p")
 
-        bbox = draw.textbbox((0, 0), date_str, font=body_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, events_y), date_str, fill=primary_text_color, font=body_font)
+        body.append(_centered_text(events_y, date_str, body_font, primary_text_color))
         events_y += 25
 
-        bbox = draw.textbbox((0, 0), time_str, font=accent_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, events_y), time_str, fill=accent_color, font=accent_font)
+        body.append(_centered_text(events_y, time_str, accent_font, accent_color))
         events_y += 30
 
         # Venue label "AT"
-        venue_label = "AT"
-        bbox = draw.textbbox((0, 0), venue_label, font=accent_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, events_y), venue_label, fill=secondary_text_color, font=accent_font)
+        body.append(_centered_text(events_y, "AT", accent_font, secondary_text_color))
         events_y += 15
 
         # Venue name
-        venue_name = event.venue
-        bbox = draw.textbbox((0, 0), venue_name, font=body_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, events_y), venue_name, fill=primary_text_color, font=body_font)
+        body.append(_centered_text(events_y, event.venue, body_font, primary_text_color))
         events_y += 30
 
+    # Bible scripture, laid out below the (optional) payment block
+    scripture_text = '"He who finds a wife finds what is good'
+    scripture_reference = 'and receives favor from the LORD."'
+    scripture_verse = "Proverbs 18:22"
+
+    scripture_y = 10
+    tail = [
+        _centered_text(scripture_y, scripture_text, accent_font, secondary_text_color),
+        _centered_text(scripture_y + 15, scripture_reference, accent_font, secondary_text_color),
+        # Scripture reference in italics style
+        _centered_text(scripture_y + 40, scripture_verse, small_font, accent_color),
+    ]
+
+    bottom_y = scripture_y + 70
+    separator_x = (card_size[0] - SEPARATOR_LENGTH) // 2
+    tail.append(("separator", (separator_x - DIAMOND_SIZE, bottom_y - DIAMOND_SIZE)))
+
+    # RSVP info if available (adjust position based on QR code)
+    if hasattr(event, "rsvp_info") and event.rsvp_info:
+        rsvp_y_offset = 30 if has_qr else 40
+        details_y_offset = 50 if has_qr else 65
+
+        tail.append(_centered_text(bottom_y + rsvp_y_offset, "RSVP", accent_font, secondary_text_color))
+        tail.append(_centered_text(bottom_y + details_y_offset, event.rsvp_info, body_font, secondary_text_color))
+
+    return CardLayout(head, body, events_y, tail)
+
+
+def get_event_layout(event, events=None, theme=DEFAULT_THEME, has_qr=True):
+    """Return the cached layout for this version of the event, building it
+    on first use. Any change to a drawn field yields a new cache entry."""
+    key = event_layout_key(event, events, theme, has_qr)
+    layout = _layout_cache.get(key)
+    if layout is not None:
+        _layout_cache.move_to_end(key)
+        return layout
+
+    layout = build_event_layout(event, events, theme, has_qr)
+    _layout_cache[key] = layout
+    if len(_layout_cache) > LAYOUT_CACHE_SIZE:
+        _layout_cache.popitem(last=False)
+    return layout
+
+
+def _draw_ops(image, draw, ops, theme, raster, dy=0):
+    for op in ops:
+        kind = op[0]
+        if kind == "text":
+            _, (x, y), text, font, fill = op
+            draw.text((x, y + dy), text, fill=fill, font=get_font(*font))
+        elif kind == "line":
+            _, points, fill, width = op
+            draw.line([(x, y + dy) for x, y in points], fill=fill, width=width)
+        elif kind == "ellipse":
+            _, (x0, y0, x1, y1), fill = op
+            draw.ellipse([x0, y0 + dy, x1, y1 + dy], fill=fill)
+        elif kind == "rectangle":
+            _, (x0, y0, x1, y1), fill, outline, width = op
+            draw.rectangle([x0, y0 + dy, x1, y1 + dy], fill=fill, outline=outline, width=width)
+        elif kind == "image":
+            _, (x, y), size, source = op
+            if source.size != size:
+                source = source.resize(size, Image.Resampling.LANCZOS)
+            image.paste(source, (x, y + dy))
+        elif kind == "separator":
+            _, (x, y) = op
+            separator = get_separator_sprite(theme, raster)
+            image.paste(separator, (x, y + dy), separator)
+
+
+def _draw_ops_scaled(image, draw, ops, theme, dy=0, scale=1, top=0):
+    """Draw ``ops`` ``scale`` times larger onto a band of the card starting
+    ``top`` pixels down; anything outside the band is clipped."""
+
+    def point(x, y):
+        return math.floor(x * scale), math.floor((y + dy) * scale) - top
+
+    for op in ops:
+        kind = op[0]
+        if kind == "text":
+            _, (x, y), text, (font_name, size), fill = op
+            draw.text(point(x, y), text, fill=fill, font=get_font(font_name, round(size * scale)))
+        elif kind == "line":
+            _, points, fill, width = op
+            draw.line(
+                [point(x, y) for x, y in points], fill=fill, width=max(1, round(width * scale))
+            )
+        elif kind == "ellipse":
+            _, (x0, y0, x1, y1), fill = op
+            draw.ellipse([*point(x0, y0), *point(x1, y1)], fill=fill)
+        elif kind == "rectangle":
+            _, (x0, y0, x1, y1), fill, outline, width = op
+            draw.rectangle(
+                [*point(x0, y0), *point(x1, y1)],
+                fill=fill,
+                outline=outline,
+                width=max(1, round(width * scale)),
+            )
+        elif kind == "image":
+            _, (x, y), (width, height), source = op
+            size = (round(width * scale), round(height * scale))
+            if source.size != size:
+                source = source.resize(size, Image.Resampling.LANCZOS)
+            image.paste(source, point(x, y))
+        elif kind == "separator":
+            _, (x, y) = op
+            separator = get_separator_sprite(theme, "pil", scale)
+            image.paste(separator, point(x, y), separator)
+
+
+def _guest_ops(layout, invitee_name=None, payment_amount=None, theme=DEFAULT_THEME):
+    """Place the event layout and the guest's own lines on the card.
+
+    Returns ``(ops, dy)`` pairs: each group of ops is drawn ``dy`` pixels
+    further down than laid out.
+    """
+    palette = CARD_THEMES[theme]
+    accent_color = palette["accent_color"]
+    secondary_text_color = palette["secondary_text_color"]
+
+    groups = [(layout.head, 0)]
+
+    # Add invitee name if provided
+    current_y = 160
+    if invitee_name:
+        groups.append(
+            ([_centered_text(current_y, f"Dear {invitee_name},", ACCENT_FONT, accent_color)], 0)
+        )
+        current_y += 25
+
+    groups.append((layout.body, current_y))
+    events_y = current_y + layout.body_height
+
     # Payment amount if provided
     if payment_amount:
         # Add some spacing
         events_y += 10
-        
-        # Payment label
-        payment_label = "Registration Fee:"
-        bbox = draw.textbbox((0, 0), payment_label, font=accent_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, events_y), payment_label, fill=secondary_text_color, font=accent_font)
+
+        payment_ops = [_centered_text(events_y, "Registration Fee:", ACCENT_FONT, secondary_text_color)]
         events_y += 20
-        
-        # Payment amount
+
         amount_text = f"${payment_amount}" if isinstance(payment_amount, (int, float)) else str(payment_amount)
-        bbox = draw.textbbox((0, 0), amount_text, font=body_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text((x_pos, events_y), amount_text, fill=accent_color, font=body_font)
+        payment_ops.append(_centered_text(events_y, amount_text, BODY_FONT, accent_color))
         events_y += 30
 
-    # Bible scripture
-    scripture_text = '"He who finds a wife finds what is good'
-    scripture_reference = 'and receives favor from the LORD."'
-    scripture_verse = "Proverbs 18:22"
-    
-    # Scripture text with line wrapping (dynamic positioning)
-    scripture_y = events_y + 10
-    bbox = draw.textbbox((0, 0), scripture_text, font=accent_font)
-    x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-    draw.text((x_pos, scripture_y), scripture_text, fill=secondary_text_color, font=accent_font)
-    
-    bbox = draw.textbbox((0, 0), scripture_reference, font=accent_font)
-    x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-    draw.text((x_pos, scripture_y + 15), scripture_reference, fill=secondary_text_color, font=accent_font)
-    
-    # Scripture reference in italics style
-    bbox = draw.textbbox((0, 0), scripture_verse, font=small_font)
-    x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-    draw.text((x_pos, scripture_y + 40), scripture_verse, fill=accent_color, font=small_font)
-
-    # Adjust bottom decorations position dynamically
-    bottom_y = scripture_y + 70
+        groups.append((payment_ops, 0))
 
-    separator_length = 200
-    separator_x = (card_size[0] - separator_length) // 2
-    draw.line(
-        [(separator_x, bottom_y), (separator_x + separator_length, bottom_y)],
-        fill=border_color,
-        width=1,
+    groups.append((layout.tail, events_y))
+    return groups
+
+
+def get_qr_error_correction(error_correction=None):
+    """Resolve the QR error-correction level ("L", "M", "Q" or "H"),
+    defaulting to the ``QR_ERROR_CORRECTION`` setting."""
+    error_correction = error_correction or getattr(settings, "QR_ERROR_CORRECTION", "M")
+    if error_correction not in QR_ERROR_CORRECTION_LEVELS:
+        raise ValueError(f"Unknown QR error correction level: {error_correction}")
+    return error_correction
+
+
+def build_qr_matrix(payload, error_correction=None):
+    """Encode ``payload`` as rows of dark (True) and light modules, without
+    a quiet zone. Build it once and draw every QR bitmap from it."""
+    qr = qrcode.QRCode(
+        error_correction=QR_ERROR_CORRECTION_LEVELS[get_qr_error_correction(error_correction)],
+        border=0,
     )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr.get_matrix()
 
-    diamond_size = 5
-    for i in range(5):
-        diamond_x = separator_x + (separator_length // 4) * i
-        diamond_points = [
-            (diamond_x, bottom_y - diamond_size),
-            (diamond_x + diamond_size, bottom_y),
-            (diamond_x, bottom_y + diamond_size),
-            (diamond_x - diamond_size, bottom_y),
-        ]
-        draw.polygon(diamond_points, fill=accent_color)
 
-    # RSVP info if available (adjust position based on QR code)
-    if hasattr(event, "rsvp_info") and event.rsvp_info:
-        rsvp_y_offset = 40 if not qr_image else 30
-        details_y_offset = 65 if not qr_image else 50
-        
-        rsvp_text = "RSVP"
-        bbox = draw.textbbox((0, 0), rsvp_text, font=accent_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text(
-            (x_pos, bottom_y + rsvp_y_offset),
-            rsvp_text,
-            fill=secondary_text_color,
-            font=accent_font,
-        )
+def _qr_modules_image(matrix, border=0):
+    modules = len(matrix) + border * 2
+    pixels = bytearray(b"\xff" * modules * modules)
+    for y, row in enumerate(matrix, start=border):
+        offset = y * modules + border
+        for x, dark in enumerate(row):
+            if dark:
+                pixels[offset + x] = 0
+    return Image.frombytes("L", (modules, modules), bytes(pixels))
 
-        rsvp_details = event.rsvp_info
-        bbox = draw.textbbox((0, 0), rsvp_details, font=body_font)
-        x_pos = (card_size[0] - (bbox[2] - bbox[0])) // 2
-        draw.text(
-            (x_pos, bottom_y + details_y_offset),
-            rsvp_details,
-            fill=secondary_text_color,
-            font=body_font,
-        )
 
-    # Corner flourishes
-    corner_size = 20
-    margin = 40
+def qr_bitmap(matrix, size=QR_SIZE):
+    """Draw ``matrix`` into a ``size`` pixel square for a card.
 
-    # Top-left corner
-    for i in range(3):
-        draw.arc(
-            [
-                margin - corner_size + i * 7,
-                margin - corner_size + i * 7,
-                margin + corner_size - i * 7,
-                margin + corner_size - i * 7,
-            ],
-            180,
-            270,
-            fill=accent_color,
-            width=1,
-        )
+    Every module gets the same whole number of pixels (nearest-neighbour,
+    so edges stay sharp) and the code is centered on white.
+    """
+    modules = len(matrix)
+    module_px = max(1, size // modules)
+    code = _qr_modules_image(matrix).resize(
+        (modules * module_px, modules * module_px), Image.Resampling.NEAREST
+    )
+    if code.width == size:
+        return code
+    bitmap = Image.new("L", (size, size), 255)
+    offset = (size - code.width) // 2
+    bitmap.paste(code, (offset, offset))
+    return bitmap
 
-    # Top-right corner
-    for i in range(3):
-        draw.arc(
-            [
-                card_size[0] - margin - corner_size + i * 7,
-                margin - corner_size + i * 7,
-                card_size[0] - margin + corner_size - i * 7,
-                margin + corner_size - i * 7,
-            ],
-            270,
-            360,
-            fill=accent_color,
-            width=1,
-        )
 
-    # Bottom-left corner
-    for i in range(3):
-        draw.arc(
-            [
-                margin - corner_size + i * 7,
-                card_size[1] - margin - corner_size + i * 7,
-                margin + corner_size - i * 7,
-                card_size[1] - margin + corner_size - i * 7,
-            ],
-            90,
-            180,
-            fill=accent_color,
-            width=1,
-        )
+def qr_png(matrix, box_size=None, border=QR_BORDER):
+    """Encode ``matrix`` as a standalone PNG with a quiet zone, at
+    ``box_size`` (default: the ``QR_BOX_SIZE`` setting) pixels per module."""
+    box_size = box_size or getattr(settings, "QR_BOX_SIZE", 10)
+    image = _qr_modules_image(matrix, border)
+    image = image.resize(
+        (image.width * box_size, image.height * box_size), Image.Resampling.NEAREST
+    ).convert("1", dither=Image.Dither.NONE)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
 
-    # Bottom-right corner
-    for i in range(3):
-        draw.arc(
-            [
-                card_size[0] - margin - corner_size + i * 7,
-                card_size[1] - margin - corner_size + i * 7,
-                card_size[0] - margin + corner_size - i * 7,
-                card_size[1] - margin + corner_size - i * 7,
-            ],
-            0,
-            90,
-            fill=accent_color,
-            width=1,
+
+def card_qr_image(payload, dpi=None):
+    """QR bitmap for ``payload`` sized for a card rendered at ``dpi``."""
+    size = QR_SIZE if not dpi else round(QR_SIZE * dpi / BASE_DPI)
+    return qr_bitmap(build_qr_matrix(payload), size)
+
+
+def _qr_ops(qr_image, theme=DEFAULT_THEME, card_size=CARD_SIZE):
+    """QR code in its framed box at the bottom left, and the "Scan" label
+    under it, as two op lists."""
+    palette = CARD_THEMES[theme]
+
+    # Position at bottom left with margin
+    qr_x = QR_MARGIN
+    qr_y = card_size[1] - QR_SIZE - QR_MARGIN
+
+    # White background with subtle border for the QR code
+    bg_x = qr_x - QR_PADDING
+    bg_y = qr_y - QR_PADDING
+    bg_size = QR_SIZE + (QR_PADDING * 2)
+    box_ops = [
+        (
+            "rectangle",
+            [bg_x, bg_y, bg_x + bg_size, bg_y + bg_size],
+            (255, 255, 255),
+            palette["border_color"],
+            1,
+        ),
+        ("image", (qr_x, qr_y), (QR_SIZE, QR_SIZE), qr_image),
+    ]
+
+    # "Scan" centered under the QR code
+    scan_text = "Scan"
+    text_x = qr_x + (QR_SIZE - measure_text(scan_text, *SMALL_FONT)) // 2
+    label_ops = [
+        ("text", (text_x, qr_y + QR_SIZE + 5), scan_text, SMALL_FONT, palette["secondary_text_color"])
+    ]
+    return box_ops, label_ops
+
+
+def scaled_card_size(dpi):
+    """Pixel size of a card rendered at ``dpi``."""
+    scale = dpi / BASE_DPI
+    return round(CARD_SIZE[0] * scale), round(CARD_SIZE[1] * scale)
+
+
+def _card_bands(height, tile_height):
+    return [(top, min(tile_height, height - top)) for top in range(0, height, tile_height)]
+
+
+def _scaled_card_ops(event, qr_image, invitee_name, events, payment_amount, theme, scale):
+    layout = get_event_layout(event, events, theme, has_qr=bool(qr_image))
+    groups = _guest_ops(layout, invitee_name, payment_amount, theme)
+    if qr_image:
+        # Resize once rather than in every band
+        qr_size = round(QR_SIZE * scale)
+        if qr_image.size != (qr_size, qr_size):
+            qr_image = qr_image.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
+        box_ops, label_ops = _qr_ops(qr_image, theme)
+        groups += [(box_ops, 0), (label_ops, 0)]
+    return groups
+
+
+def _render_card_band(groups, theme, scale, top, height):
+    # Shapes crossing a band edge rasterize slightly differently where they
+    # are clipped, so draw a few extra rows on each side and crop them off
+    full_height = round(CARD_SIZE[1] * scale)
+    above = min(top, CARD_TILE_OVERLAP)
+    below = min(full_height - top - height, CARD_TILE_OVERLAP)
+
+    band = _render_card_background(
+        CARD_SIZE, CARD_THEMES[theme], scale, top - above, above + height + below
+    )
+    draw = ImageDraw.Draw(band)
+    for ops, dy in groups:
+        _draw_ops_scaled(band, draw, ops, theme, dy, scale, top - above)
+    if above or below:
+        band = band.crop((0, above, band.width, above + height))
+    return band
+
+
+def render_card_tiles(event, qr_image=None, invitee_name=None, events=None, payment_amount=None, theme=DEFAULT_THEME, dpi=CARD_TILE_DPI, tile_height=CARD_TILE_HEIGHT):
+    """Draw a card at ``dpi`` and yield it as ``(top, tile)`` horizontal
+    bands. Each band is drawn when it is pulled, so a caller that consumes
+    them one at a time (e.g. the print sheets) only holds one band of the
+    card in memory."""
+    scale = dpi / BASE_DPI
+    groups = _scaled_card_ops(event, qr_image, invitee_name, events, payment_amount, theme, scale)
+    for top, height in _card_bands(scaled_card_size(dpi)[1], tile_height):
+        yield top, _render_card_band(groups, theme, scale, top, height)
+
+
+def _render_scaled_card(event, qr_image, invitee_name, events, payment_amount, theme, dpi, max_workers=None):
+    scale = dpi / BASE_DPI
+    size = scaled_card_size(dpi)
+    groups = _scaled_card_ops(event, qr_image, invitee_name, events, payment_amount, theme, scale)
+
+    if dpi >= CARD_TILE_DPI:
+        bands = _card_bands(size[1], CARD_TILE_HEIGHT)
+    else:
+        bands = [(0, size[1])]
+
+    def render_band(band):
+        return _render_card_band(groups, theme, scale, *band)
+
+    image = Image.new("RGB", size)
+    if max_workers and max_workers > 1 and len(bands) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for (top, _), tile in zip(bands, pool.map(render_band, bands)):
+                image.paste(tile, (0, top))
+    else:
+        for band in bands:
+            image.paste(render_band(band), (0, band[0]))
+    return image
+
+
+class StageTimer:
+    """Adds the wall time since the previous lap to ``timings[stage]``.
+
+    Does nothing when ``timings`` is None, so the render path only pays
+    for the clock when a caller asks for per-stage timings.
+    """
+
+    def __init__(self, timings=None):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else None
+
+    def lap(self, stage):
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+def render_wedding_card(event, qr_image=None, invitee_name=None, events=None, payment_amount=None, theme=DEFAULT_THEME, raster=None, timings=None, dpi=None, max_workers=None):
+    """Draw a guest's card and return it as an RGB image.
+
+    Pass a dict as ``timings`` to collect seconds spent per stage. ``dpi``
+    renders a print-resolution card, scaling every coordinate and font
+    from BASE_DPI; from CARD_TILE_DPI up it is drawn in horizontal bands,
+    on ``max_workers`` threads if given. The bands are pasted into one
+    full-size image, so memory still grows with the card; use
+    ``render_card_tiles`` where that matters.
+    """
+    if dpi and dpi != BASE_DPI:
+        return _render_scaled_card(
+            event, qr_image, invitee_name, events, payment_amount, theme, dpi, max_workers
         )
 
+    timer = StageTimer(timings)
+    layout = get_event_layout(event, events, theme, has_qr=bool(qr_image))
+    timer.lap("text_layout")
+
+    # Start from a copy of the shared background layer
+    image = get_card_background(CARD_SIZE, theme, raster).copy()
+    draw = ImageDraw.Draw(image)
+    timer.lap("background")
+
+    for ops, dy in _guest_ops(layout, invitee_name, payment_amount, theme):
+        _draw_ops(image, draw, ops, theme, raster, dy=dy)
+    timer.lap("text_layout")
+
     # QR Code placement - smaller size at bottom left
     if qr_image:
-        # Smaller QR code
-        qr_size = 80  # Reduced from 160 to 80
-        
-        # Position at bottom left with margin
-        margin_from_edge = 50
-        qr_x = margin_from_edge
-        qr_y = card_size[1] - qr_size - margin_from_edge
-        
-        # Create a white background with subtle border for the QR code
-        padding = 8  # Reduced padding
-        bg_x = qr_x - padding
-        bg_y = qr_y - padding
-        bg_size = qr_size + (padding * 2)
-        
-        # Draw white background
-        draw.rectangle(
-            [bg_x, bg_y, bg_x + bg_size, bg_y + bg_size],
-            fill=(255, 255, 255),
-            outline=border_color,
-            width=1
-        )
-        
-        # Resize and paste the QR code
-        qr_resized = qr_image.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-        image.paste(qr_resized, (qr_x, qr_y))
-        
-        # Add "Scan" text below QR code (smaller text)
-        scan_text = "Scan"
-        bbox = draw.textbbox((0, 0), scan_text, font=small_font)
-        text_x = qr_x + (qr_size - (bbox[2] - bbox[0])) // 2  # Center under QR code
-        text_y = qr_y + qr_size + 5
-        draw.text(
-            (text_x, text_y),
-            scan_text,
-            fill=secondary_text_color,
-            font=small_font,
-        )
+        box_ops, label_ops = _qr_ops(qr_image, theme)
+        _draw_ops(image, draw, box_ops, theme, raster)
+        timer.lap("qr_resize")
 
-    # Save image to BytesIO buffer
-    buffer = BytesIO()
-    image.save(buffer, format="PNG", optimize=True, quality=95)
-    buffer.seek(0)
+        _draw_ops(image, draw, label_ops, theme, raster)
+        timer.lap("text_layout")
+
+    return image
 
+
+def card_file_name(event, card_format, suffix=""):
     # Safe file name
     safe_title = "".join(
         c for c in event.title if c.isalnum() or c in (" ", "-", "_")
     ).rstrip()
-    file_name = f"wedding_invitation_{safe_title}_{event.id}.png"
+    extension = CARD_FORMATS[card_format]["extension"]
+    return f"wedding_invitation_{safe_title}_{event.id}{suffix}.{extension}"
+
+
+def wrap_card_file(image, event, card_format=None, suffix="", timings=None):
+    """Encode a rendered card into an upload-ready file."""
+    timer = StageTimer(timings)
+
+    # Encode to a BytesIO buffer
+    buffer, card_format = encode_card(image, card_format)
+    timer.lap("encode")
+    file_name = card_file_name(event, card_format, suffix)
 
     # Return as InMemoryUploadedFile for Django
-    return InMemoryUploadedFile(
-        buffer, None, file_name, "image/png", buffer.getbuffer().nbytes, None
-    )
\ No newline at end of file
+    card_file = InMemoryUploadedFile(
+        buffer,
+        None,
+        file_name,
+        CARD_FORMATS[card_format]["content_type"],
+        buffer.getbuffer().nbytes,
+        None,
+    )
+    timer.lap("wrap")
+    return card_file
+
+
+def generate_card_derivatives(image, event, card_format=None):
+    """Downscaled copies of a rendered card, keyed by derivative name.
+
+    Sizes divide the card size evenly, so ``Image.reduce`` can box-filter
+    them straight from the in-memory render.
+    """
+    derivatives = {}
+    for name, (width, height) in CARD_DERIVATIVES.items():
+        factor = image.width // width
+        if factor > 1 and image.width == width * factor and image.height == height * factor:
+            derivative = image.reduce(factor)
+        else:
+            derivative = image.resize((width, height), Image.Resampling.LANCZOS)
+        derivatives[name] = wrap_card_file(derivative, event, card_format, f"_{name}")
+    return derivatives
+
+
+def _cached_card_files(key, names):
+    """Look up ``names`` in the card cache, returning upload-ready files or
+    None when the cache is disabled, the key is unknown or a name is missing."""
+    cache = get_card_cache()
+    if cache is None or key is None:
+        return None
+    cached = cache.get(key)
+    if cached is None or not all(name in cached for name in names):
+        return None
+    return {
+        name: ContentFile(content, name=file_name)
+        for name, (file_name, content) in cached.items()
+        if name in names
+    }
+
+
+def _store_card_files(key, files):
+    cache = get_card_cache()
+    if cache is None or key is None:
+        return
+    entries = {}
+    for name, card_file in files.items():
+        entries[name] = (card_file.name, card_file.read())
+        card_file.seek(0)
+    cache.set(key, entries)
+
+
+def _card_cache_key(event, events, invitee_name, payment_amount, qr_image, qr_payload, theme, card_format, raster=None):
+    # A QR code can only be part of the key when its payload is known
+    if qr_image is not None and not qr_payload:
+        return None
+    if get_card_cache() is None:
+        return None
+    fingerprint = card_fingerprint(
+        event,
+        events=events,
+        invitee_name=invitee_name,
+        payment_amount=payment_amount,
+        qr_payload=qr_payload,
+        theme=theme,
+        card_format=card_format,
+    )
+    # The backends' output isn't bit-identical, so they don't share entries
+    return hashlib.sha256(
+        f"{fingerprint}:{get_raster_backend(raster)}".encode("utf-8")
+    ).hexdigest()
+
+
+def generate_card_files(event, qr_image=None, invitee_name=None, events=None, payment_amount=None, theme=DEFAULT_THEME, raster=None, card_format=None, qr_payload=None):
+    """Render a card and its derivatives as ``{"card": file, "thumbnail":
+    file, ...}``, reusing the stored files when the render inputs were
+    seen before. Pass ``qr_payload`` alongside ``qr_image`` so the QR code
+    can be part of the cache key."""
+    names = ["card", *CARD_DERIVATIVES]
+    key = _card_cache_key(
+        event, events, invitee_name, payment_amount, qr_image, qr_payload, theme, card_format, raster
+    )
+    files = _cached_card_files(key, names)
+    if files is not None:
+        return files
+
+    image = render_wedding_card(
+        event,
+        qr_image=qr_image,
+        invitee_name=invitee_name,
+        events=events,
+        payment_amount=payment_amount,
+        theme=theme,
+        raster=raster,
+    )
+    files = {"card": wrap_card_file(image, event, card_format)}
+    files.update(generate_card_derivatives(image, event, card_format))
+    _store_card_files(key, files)
+    return files
+
+
+def generate_wedding_card(event, invitation=None, qr_image=None, invitee_name=None, events=None, payment_amount=None, theme=DEFAULT_THEME, raster=None, card_format=None, qr_payload=None):
+    key = _card_cache_key(
+        event, events, invitee_name, payment_amount, qr_image, qr_payload, theme, card_format, raster
+    )
+    files = _cached_card_files(key, ["card"])
+    if files is not None:
+        return files["card"]
+
+    image = render_wedding_card(
+        event,
+        qr_image=qr_image,
+        invitee_name=invitee_name,
+        events=events,
+        payment_amount=payment_amount,
+        theme=theme,
+        raster=raster,
+    )
+    card_file = wrap_card_file(image, event, card_format)
+    _store_card_files(key, {"card": card_file})
+    return card_file
+
+
+def get_invitee_name(guest):
+    """Name printed after "Dear" on a guest's card."""
+    if guest.guest_name:
+        return guest.guest_name
+    elif guest.first_name and guest.last_name:
+        return f"{guest.first_name} {guest.last_name}"
+    elif guest.first_name:
+        return guest.first_name
+    return None
+
+
+def get_event_schedules(event, schedules=None):
+    """Convert an event's schedules into the ``events`` list the generator
+    takes. Returns None unless there is more than one schedule, in which
+    case the card falls back to the single event date and venue."""
+    if schedules is None:
+        schedules = event.event_schedules.all()
+    events_data = [
+        {
+            'name': schedule.event_name,
+            'date': schedule.date.strftime("%A, %B %d, %Y"),
+            'time': schedule.date.strftime("%I:%M %p"),
+            'location': schedule.location,
+            'description': schedule.description or ''
+        }
+        for schedule in schedules
+    ]
+    return events_data if len(events_data) > 1 else None
+
+
+def get_verify_url(guest):
+    """URL encoded in a guest's QR code: a signed token URL when
+    ``QR_SIGNED_TOKENS`` is on, otherwise the plain verify URL."""
+    base_url = getattr(settings, "SITE_URL", "http://localhost:8000")
+    if getattr(settings, "QR_SIGNED_TOKENS", False):
+        return token_verify_url(guest, base_url)
+    return f"{base_url}{reverse('verify_invitation', args=[str(guest.id)])}"
+
+
+CardRenderResult = namedtuple(
+    "CardRenderResult", ["guest_id", "card_file", "qr_file", "derivatives"]
+)
+
+
+def _init_render_worker(theme, raster):
+    warmup_fonts()
+    get_card_background(CARD_SIZE, theme, raster)
+    get_separator_sprite(theme, raster)
+
+
+def _render_card_job(event, events, job, theme, raster, card_format):
+    guest_id, invitee_name, payment_amount, qr_payload = job
+
+    qr_matrix = build_qr_matrix(qr_payload)
+    files = generate_card_files(
+        event,
+        qr_image=qr_bitmap(qr_matrix),
+        invitee_name=invitee_name,
+        events=events,
+        payment_amount=payment_amount,
+        theme=theme,
+        raster=raster,
+        card_format=card_format,
+        qr_payload=qr_payload,
+    )
+    return (
+        guest_id,
+        {name: (file.name, file.read()) for name, file in files.items()},
+        qr_png(qr_matrix),
+    )
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+_render_pools = {}
+_render_pools_lock = threading.Lock()
+
+
+def can_start_render_pool():
+    """Whether this process may start worker processes. Daemonic ones,
+    like the children of Celery's default prefork pool, can't."""
+    return not multiprocessing.current_process().daemon
+
+
+def get_render_pool(max_workers, theme=DEFAULT_THEME, raster=None):
+    """This process's long-lived render pool for ``max_workers`` workers,
+    started (and its workers warmed up) on first use, so consecutive
+    batches don't pay for new processes."""
+    key = (max_workers, theme, get_raster_backend(raster))
+    with _render_pools_lock:
+        if key not in _render_pools:
+            _render_pools[key] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_render_worker,
+                initargs=key[1:],
+            )
+        return _render_pools[key]
+
+
+def discard_render_pool(executor):
+    """Shut down a render pool that broke, so the next batch starts a new one."""
+    with _render_pools_lock:
+        for key, pool in list(_render_pools.items()):
+            if pool is executor:
+                del _render_pools[key]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+class CardRenderBatch:
+    """Renders a set of guest cards across a process pool.
+
+    Iterating the batch yields a ``CardRenderResult`` per guest as soon as
+    its card is ready, in completion order. Jobs are submitted in a window
+    of a few per worker, so ``cancel()`` stops the batch without waiting
+    for the whole backlog. ``throughput`` reports cards per second.
+
+    The batch starts and stops its own pool unless given a shared
+    ``executor`` (see ``get_render_pool``).
+    """
+
+    JOBS_PER_WORKER = 4
+
+    def __init__(self, event, events, jobs, max_workers=None, theme=DEFAULT_THEME, raster=None, card_format=None, executor=None):
+        self.executor = executor
+        self.event = event
+        self.events = events
+        self.jobs = list(jobs)
+        self.max_workers = max_workers or available_cpus()
+        self.theme = theme
+        self.raster = get_raster_backend(raster)
+        self.card_format = get_card_format(card_format)
+        self.completed = 0
+        self.started_at = None
+        self.finished_at = None
+        self._cancelled = threading.Event()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def throughput(self):
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed else 0.0
+
+    def __iter__(self):
+        self.started_at = time.perf_counter()
+        pending_jobs = iter(self.jobs)
+        in_flight = set()
+        window = self.max_workers * self.JOBS_PER_WORKER
+
+        executor = self.executor or ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_render_worker,
+            initargs=(self.theme, self.raster),
+        )
+        try:
+            while True:
+                while not self.cancelled and len(in_flight) < window:
+                    job = next(pending_jobs, None)
+                    if job is None:
+                        break
+                    in_flight.add(executor.submit(
+                        _render_card_job,
+                        self.event,
+                        self.events,
+                        job,
+                        self.theme,
+                        self.raster,
+                        self.card_format,
+                    ))
+                if not in_flight or self.cancelled:
+                    break
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    guest_id, files, qr_bytes = future.result()
+                    files = {
+                        name: ContentFile(content, name=file_name)
+                        for name, (file_name, content) in files.items()
+                    }
+                    self.completed += 1
+                    yield CardRenderResult(
+                        guest_id,
+                        files.pop("card"),
+                        ContentFile(qr_bytes, name=f"guest_qr_{guest_id}.png"),
+                        files,
+                    )
+        finally:
+            self.finished_at = time.perf_counter()
+            if self.executor is None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            else:
+                # Leave the shared pool running, minus this batch's jobs
+                for future in in_flight:
+                    future.cancel()
+            logger.info(
+                "Rendered %s/%s cards for event %s in %.2fs (%.1f cards/sec)%s",
+                self.completed,
+                len(self.jobs),
+                getattr(self.event, "id", ""),
+                self.elapsed,
+                self.throughput,
+                " [cancelled]" if self.cancelled else "",
+            )
+
+
+def render_event_cards(event, guests=None, max_workers=None, theme=DEFAULT_THEME, raster=None, events=None, executor=None):
+    """Render cards for every guest of ``event`` (or ``guests``) in parallel.
+
+    Returns a ``CardRenderBatch`` to iterate; database access happens here,
+    in the calling process, and the worker processes only draw.
+    ``cards.rendering.render_guest_cards`` stores the results.
+    """
+    if guests is None:
+        guests = [
+            guest
+            for invitation in event.invitations.prefetch_related("guests")
+            for guest in invitation.guests.all()
+        ]
+
+    if events is None:
+        events = get_event_schedules(event)
+    snapshot = SimpleNamespace(
+        id=event.id,
+        title=event.title,
+        couple=event.couple,
+        date=event.date,
+        venue=event.venue,
+    )
+    jobs = [
+        (guest.id, get_invitee_name(guest), guest.payment_amount, get_verify_url(guest))
+        for guest in guests
+    ]
+    return CardRenderBatch(
+        snapshot, events, jobs, max_workers, theme, raster, event.card_format, executor
+    )
@@ -0,0 +1,154 @@
+from io import BytesIO
+
+from PIL import Image, ImageDraw, PdfParser
+
+from utils.generators import BASE_DPI, CARD_SIZE, scaled_card_size
+
+# Page sizes in inches
+PRINT_PAGE_SIZES = {
+    "a4": (8.27, 11.69),
+    "letter": (8.5, 11.0),
+}
+
+PRINT_DPI = 300
+PRINT_MARGIN = 0.25  # inches
+PRINT_GUTTER = 0.125  # inches
+CUT_MARK_COLOR = (200, 200, 200)
+
+
+def nup_layout(page_size="a4", columns=2, rows=2, dpi=PRINT_DPI):
+    """Work out an N-up sheet.
+
+    Returns ``(page_px, card_dpi, card_px, origins)``: the page size in
+    pixels, the resolution to render cards at so they fill their cells, the
+    resulting card size and the top-left corner of every slot, row by row.
+    """
+    page_w, page_h = PRINT_PAGE_SIZES[page_size]
+    page_px = (round(page_w * dpi), round(page_h * dpi))
+    margin = round(PRINT_MARGIN * dpi)
+    gutter = round(PRINT_GUTTER * dpi)
+
+    cell_w = (page_px[0] - 2 * margin - (columns - 1) * gutter) // columns
+    cell_h = (page_px[1] - 2 * margin - (rows - 1) * gutter) // rows
+    card_dpi = BASE_DPI * min(cell_w / CARD_SIZE[0], cell_h / CARD_SIZE[1])
+    card_px = scaled_card_size(card_dpi)
+
+    # Center the grid on the page
+    grid_w = columns * card_px[0] + (columns - 1) * gutter
+    grid_h = rows * card_px[1] + (rows - 1) * gutter
+    left = (page_px[0] - grid_w) // 2
+    top = (page_px[1] - grid_h) // 2
+    origins = [
+        (left + column * (card_px[0] + gutter), top + row * (card_px[1] + gutter))
+        for row in range(rows)
+        for column in range(columns)
+    ]
+    return page_px, card_dpi, card_px, origins
+
+
+def print_card_dpi(page_size="a4", columns=2, rows=2, dpi=PRINT_DPI):
+    """Resolution to render cards at for an N-up sheet."""
+    return nup_layout(page_size, columns, rows, dpi)[1]
+
+
+def _draw_cut_marks(draw, origin, card_px, length):
+    x0, y0 = origin
+    x1, y1 = x0 + card_px[0], y0 + card_px[1]
+    for x, y, dx, dy in ((x0, y0, -1, -1), (x1, y0, 1, -1), (x0, y1, -1, 1), (x1, y1, 1, 1)):
+        draw.line([(x + dx, y), (x + dx * length, y)], fill=CUT_MARK_COLOR)
+        draw.line([(x, y + dy), (x, y + dy * length)], fill=CUT_MARK_COLOR)
+
+
+def iter_print_pages(cards, page_size="a4", columns=2, rows=2, dpi=PRINT_DPI):
+    """Lay ``cards`` (an iterable, ideally a generator) out N-up and yield
+    one page image at a time.
+
+    A card is either an image, scaled to fit if it wasn't rendered at
+    ``print_card_dpi()``, or an iterator of ``(top, tile)`` bands from
+    ``render_card_tiles`` at ``print_card_dpi()``, pasted band by band.
+    Each card is dropped before the next one is pulled, so only the
+    current page and card (or band) are held in memory.
+    """
+    page_px, _, card_px, origins = nup_layout(page_size, columns, rows, dpi)
+    cut_mark_length = round(PRINT_GUTTER * dpi / 2)
+
+    page = None
+    slot = 0
+    for card in cards:
+        if page is None:
+            page = Image.new("RGB", page_px, "white")
+            draw = ImageDraw.Draw(page)
+        left, top = origins[slot]
+        if isinstance(card, Image.Image):
+            if card.size != card_px:
+                card = card.resize(card_px, Image.Resampling.LANCZOS)
+            page.paste(card, (left, top))
+        else:
+            for band_top, tile in card:
+                if tile.width != card_px[0] or band_top + tile.height > card_px[1]:
+                    raise ValueError("Card tiles must be rendered at print_card_dpi()")
+                page.paste(tile, (left, top + band_top))
+        _draw_cut_marks(draw, origins[slot], card_px, cut_mark_length)
+
+        slot += 1
+        if slot == len(origins):
+            yield page
+            page = None
+            slot = 0
+    if page is not None:
+        yield page
+
+
+def write_print_pdf(cards, path, page_size="a4", columns=2, rows=2, dpi=PRINT_DPI):
+    """Write ``cards`` N-up into a multi-page PDF at ``path`` in one pass.
+
+    Each page is JPEG-encoded and written as soon as it is laid out; the
+    page tree, catalog and the single xref table follow the last page, so
+    neither the pages nor the file are ever revisited. Returns the number
+    of pages written.
+    """
+    with open(path, "wb") as f:
+        pdf = PdfParser.PdfParser(f=f, mode="wb")
+        pdf.start_writing()
+        pdf.write_header()
+        pdf.root_ref = pdf.next_object_id(0)
+        pdf.pages_ref = pdf.next_object_id(0)
+
+        for page in iter_print_pages(cards, page_size, columns, rows, dpi):
+            image = BytesIO()
+            page.save(image, "JPEG")
+            image_ref = pdf.write_obj(
+                None,
+                stream=image.getvalue(),
+                Type=PdfParser.PdfName("XObject"),
+                Subtype=PdfParser.PdfName("Image"),
+                Width=page.width,
+                Height=page.height,
+                ColorSpace=PdfParser.PdfName("DeviceRGB"),
+                BitsPerComponent=8,
+                Filter=PdfParser.PdfName("DCTDecode"),
+            )
+            width = page.width * 72.0 / dpi
+            height = page.height * 72.0 / dpi
+            contents_ref = pdf.write_obj(
+                None, stream=b"q %f 0 0 %f 0 0 cm /image Do Q\n" % (width, height)
+            )
+            pdf.pages.append(pdf.write_page(
+                None,
+                Resources=PdfParser.PdfDict(
+                    ProcSet=[PdfParser.PdfName("PDF"), PdfParser.PdfName("ImageC")],
+                    XObject=PdfParser.PdfDict(image=image_ref),
+                ),
+                MediaBox=[0, 0, width, height],
+                Contents=contents_ref,
+            ))
+
+        pdf.write_obj(
+            pdf.pages_ref,
+            Type=PdfParser.PdfName("Pages"),
+            Count=len(pdf.pages),
+            Kids=pdf.pages,
+        )
+        pdf.write_obj(pdf.root_ref, Type=PdfParser.PdfName("Catalog"), Pages=pdf.pages_ref)
+        pdf.write_xref_and_trailer()
+    return len(pdf.pages)
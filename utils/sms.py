@@ -0,0 +1,202 @@
+import json
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import phonenumbers
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+SMSMessage = namedtuple("SMSMessage", ["to", "body"])
+SMSResult = namedtuple(
+    "SMSResult", ["message", "sent", "attempts", "latency_ms", "error", "transient"]
+)
+
+# In-memory outbox of the "locmem" provider, like django.core.mail.outbox
+outbox = []
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+class SMSError(Exception):
+    """A message, or a whole batch, could not be sent. ``transient`` says
+    whether trying again later may succeed."""
+
+    def __init__(self, message, transient=True):
+        super().__init__(message)
+        self.transient = transient
+
+
+def normalize_number(phone, region=None):
+    """``phone`` in E.164 form, reading numbers without a country code as
+    local to ``region``; None if it isn't a valid number."""
+    try:
+        parsed = phonenumbers.parse(phone, region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+class RateLimiter:
+    """Paces sends to ``rate`` messages per second within this process.
+
+    Each call reserves the time its messages take at that rate, so
+    concurrent callers queue up behind each other instead of bursting.
+    """
+
+    def __init__(self, rate, clock=time.monotonic):
+        self.rate = rate
+        self.clock = clock
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def delay(self, count):
+        """Seconds to wait before sending ``count`` messages."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            start = max(now, self._next)
+            self._next = start + count / self.rate
+        return start - now
+
+
+class BaseSMSProvider:
+    """A way of sending text messages.
+
+    Subclasses implement ``send_batch``, which sends up to ``batch_size``
+    messages in one call and returns an error (an ``SMSError``) or None
+    per message, and raises ``SMSError`` if the whole batch failed.
+    """
+
+    def __init__(self, rate=None, batch_size=100, sender=None, **options):
+        self.limiter = RateLimiter(rate)
+        self.batch_size = batch_size
+        self.sender = sender
+        self.options = options
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+
+class ConsoleSMSProvider(BaseSMSProvider):
+    """Writes messages to stdout, for development."""
+
+    def send_batch(self, messages):
+        stream = self.options.get("stream") or sys.stdout
+        for message in messages:
+            stream.write(f"SMS from {self.sender or '-'} to {message.to}:\n")
+            stream.write(f"{message.body}\n{'-' * 40}\n")
+        stream.flush()
+        return [None] * len(messages)
+
+
+class FileSMSProvider(BaseSMSProvider):
+    """Appends messages as JSON lines to the file at ``path``."""
+
+    def send_batch(self, messages):
+        sent_at = datetime.now(timezone.utc).isoformat()
+        with open(self.options["path"], "a", encoding="utf-8") as outfile:
+            for message in messages:
+                outfile.write(json.dumps({
+                    "sent_at": sent_at,
+                    "from": self.sender,
+                    "to": message.to,
+                    "body": message.body,
+                }) + "\n")
+        return [None] * len(messages)
+
+
+class LocmemSMSProvider(BaseSMSProvider):
+    """Keeps messages in ``utils.sms.outbox``, for tests."""
+
+    def send_batch(self, messages):
+        outbox.extend(messages)
+        return [None] * len(messages)
+
+
+SMS_PROVIDER_BACKENDS = {
+    "console": ConsoleSMSProvider,
+    "file": FileSMSProvider,
+    "locmem": LocmemSMSProvider,
+}
+
+
+def get_sms_provider(alias="default"):
+    """Return this process's provider configured as ``SMS_PROVIDERS[alias]``.
+
+    ``BACKEND`` is one of ``SMS_PROVIDER_BACKENDS`` or the dotted path of a
+    ``BaseSMSProvider`` subclass; ``RATE`` (messages per second),
+    ``BATCH_SIZE``, ``SENDER`` and ``OPTIONS`` are passed to it. Instances
+    are shared, so their rate limit covers every sender in the process.
+    """
+    if alias not in _providers:
+        with _providers_lock:
+            if alias not in _providers:
+                config = getattr(settings, "SMS_PROVIDERS", {}).get(alias) or {"BACKEND": "console"}
+                backend = config["BACKEND"]
+                provider_class = SMS_PROVIDER_BACKENDS.get(backend) or import_string(backend)
+                _providers[alias] = provider_class(
+                    rate=config.get("RATE"),
+                    batch_size=config.get("BATCH_SIZE", 100),
+                    sender=config.get("SENDER"),
+                    **config.get("OPTIONS", {}),
+                )
+    return _providers[alias]
+
+
+@receiver(setting_changed)
+def _reset_providers(setting, **kwargs):
+    if setting == "SMS_PROVIDERS":
+        _providers.clear()
+
+
+def send_messages(provider, messages, max_retries=3, backoff=1.0, sleep=time.sleep):
+    """Send ``messages`` through ``provider``, ``batch_size`` at a time at
+    its rate limit.
+
+    Transient failures, of single messages or of a whole batch, are retried
+    up to ``max_retries`` times with exponential backoff. Returns an
+    ``SMSResult`` per message, in order.
+    """
+    results = {}
+    for start in range(0, len(messages), provider.batch_size):
+        pending = list(enumerate(messages[start:start + provider.batch_size], start))
+        for attempt in range(1, max_retries + 2):
+            if attempt > 1:
+                sleep(backoff * 2 ** (attempt - 2))
+            wait = provider.limiter.delay(len(pending))
+            if wait:
+                sleep(wait)
+
+            started = time.monotonic()
+            try:
+                errors = provider.send_batch([message for _, message in pending])
+            except SMSError as exc:
+                errors = [exc] * len(pending)
+            latency_ms = round((time.monotonic() - started) * 1000)
+
+            retry = []
+            for (index, message), error in zip(pending, errors):
+                transient = error is not None and getattr(error, "transient", True)
+                results[index] = SMSResult(
+                    message,
+                    error is None,
+                    attempt,
+                    latency_ms,
+                    str(error) if error is not None else None,
+                    transient,
+                )
+                if transient:
+                    retry.append((index, message))
+            if not retry:
+                break
+            pending = retry
+    return [results[index] for index in range(len(messages))]
@@ -0,0 +1,101 @@
+import base64
+import struct
+import uuid
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# Version, guest UUID, first 4 bytes of the event UUID and the last valid
+# day (days since the epoch), followed by a truncated HMAC. 31 bytes make a
+# 50 character base32 token.
+TOKEN_VERSION = 1
+TOKEN_MAC_BYTES = 8
+TOKEN_SALT = "cards.tokens.verify"
+
+_payload = struct.Struct(">B16s4sH")
+_epoch = date(1970, 1, 1)
+
+VerifyToken = namedtuple("VerifyToken", ["guest_id", "event_tag", "expires"])
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+def event_tag(event_id):
+    """Short tag tying a token to its event without a database lookup."""
+    return uuid.UUID(str(event_id)).bytes[:4]
+
+
+def _mac(payload):
+    return salted_hmac(TOKEN_SALT, payload, algorithm="sha256").digest()[:TOKEN_MAC_BYTES]
+
+
+def make_token(guest_id, event_id, expires):
+    """Sign ``guest_id`` and ``event_id`` into a token valid through the
+    ``expires`` date (UTC)."""
+    payload = _payload.pack(
+        TOKEN_VERSION,
+        uuid.UUID(str(guest_id)).bytes,
+        event_tag(event_id),
+        (expires - _epoch).days,
+    )
+    # Base32 only uses characters from the QR alphanumeric set
+    return base64.b32encode(payload + _mac(payload)).decode("ascii").rstrip("=")
+
+
+def read_token(token, today=None):
+    """Check a token's signature and expiry without touching the database.
+
+    Raises InvalidToken for anything malformed or forged and ExpiredToken
+    once its last valid day has passed.
+    """
+    try:
+        raw = base64.b32decode(token.upper() + "=" * (-len(token) % 8))
+    except (ValueError, TypeError):
+        raise InvalidToken("Malformed token")
+    if len(raw) != _payload.size + TOKEN_MAC_BYTES:
+        raise InvalidToken("Malformed token")
+
+    payload, mac = raw[:_payload.size], raw[_payload.size:]
+    if not constant_time_compare(mac, _mac(payload)):
+        raise InvalidToken("Bad signature")
+
+    version, guest_id, tag, expires = _payload.unpack(payload)
+    if version != TOKEN_VERSION:
+        raise InvalidToken("Unsupported token version")
+
+    expires = _epoch + timedelta(days=expires)
+    if (today or datetime.now(timezone.utc).date()) > expires:
+        raise ExpiredToken("Token expired")
+    return VerifyToken(uuid.UUID(bytes=guest_id), tag, expires)
+
+
+def guest_token(guest):
+    """Token for a guest's card, valid until ``QR_TOKEN_GRACE_DAYS`` after
+    the event."""
+    event = guest.invitation.event
+    grace = timedelta(days=getattr(settings, "QR_TOKEN_GRACE_DAYS", 2))
+    return make_token(guest.id, event.id, event.date.date() + grace)
+
+
+def token_verify_url(guest, base_url):
+    """Signed verify URL for a guest's QR code.
+
+    The scheme and host are upper-cased (both are case-insensitive) so the
+    whole URL fits the QR alphanumeric mode, which packs about a third more
+    characters per module than byte mode.
+    """
+    parts = urlsplit(base_url)
+    base_url = urlunsplit(
+        (parts.scheme.upper(), parts.netloc.upper(), parts.path, "", "")
+    )
+    return f"{base_url}{reverse('verify_token', args=[guest_token(guest)])}"
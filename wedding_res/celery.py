@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_init
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wedding_res.settings")
 
@@ -10,4 +11,16 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 app.autodiscover_tasks()
 
-app.conf.beat_schedule = {}
+app.conf.beat_schedule = {
+    "dispatch-deferred-card-renders": {
+        "task": "cards.tasks.dispatch_deferred_renders",
+        "schedule": 60.0,
+    },
+}
+
+
+@worker_init.connect
+def warmup_card_renderer(**kwargs):
+    from utils.generators import warmup_fonts
+
+    warmup_fonts()
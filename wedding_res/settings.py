@@ -97,6 +97,42 @@ else:
         },
     }
 
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL)
+# Without a worker (local development) tasks run inline
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", str(DEBUG)) == "True"
+# Card rendering runs on its own queue (and workers), so a large import or
+# re-render can't hold up other tasks
+CELERY_TASK_ROUTES = {
+    "cards.tasks.render_guest_card_task": {"queue": "card_render"},
+    "cards.tasks.render_guest_card_batch": {"queue": "card_render"},
+    "cards.tasks.build_print_sheet": {"queue": "card_render"},
+}
+# Card renders carry a priority per lane (see cards.scheduler): new
+# guests' cards first, then bulk imports, then re-renders. Workers take one
+# task at a time so queued priorities aren't bypassed by prefetching.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "queue_order_strategy": "priority",
+    "priority_steps": list(range(10)),
+    "sep": ":",
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Admission control for bulk and re-render work: chunks in flight per
+# planner, and cards queued across both lanes before more are deferred
+RENDER_PLANNER_MAX_CHUNKS = int(os.getenv("RENDER_PLANNER_MAX_CHUNKS", 4))
+RENDER_QUEUE_MAX_DEPTH = int(os.getenv("RENDER_QUEUE_MAX_DEPTH", 2000))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Render queue counters, shared by the web and worker processes
+    "render_scheduler": (
+        {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "render-scheduler"}
+        if CELERY_TASK_ALWAYS_EAGER
+        else {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}
+    ),
+}
+
 
 AUTH_USER_MODEL = "cards.User"
 
@@ -133,6 +169,30 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
+# Invitation emails are sent by a Celery task over one connection, in
+# batches of INVITATION_EMAIL_BATCH_SIZE, at most INVITATION_EMAIL_RATE
+# messages per second (0 for no limit). Failures are retried per batch.
+INVITATION_EMAIL_BATCH_SIZE = int(os.getenv("INVITATION_EMAIL_BATCH_SIZE", 50))
+INVITATION_EMAIL_RATE = float(os.getenv("INVITATION_EMAIL_RATE", 10))
+INVITATION_EMAIL_MAX_RETRIES = int(os.getenv("INVITATION_EMAIL_MAX_RETRIES", 3))
+# A dispatch that hasn't finished a batch for this many seconds is treated
+# as abandoned (e.g. its worker died) and its guests can be sent again
+INVITATION_DISPATCH_STALE_AFTER = int(os.getenv("INVITATION_DISPATCH_STALE_AFTER", 15 * 60))
+
+# Text messages (invitations to guests without an email, and allauth's
+# phone verification codes) go through utils.sms. BACKEND is "console",
+# "file" (JSON lines at OPTIONS["path"]), "locmem" or the dotted path of a
+# provider class; RATE is messages per second per worker process.
+SMS_PROVIDERS = {
+    "default": {
+        "BACKEND": os.getenv("SMS_BACKEND", "console"),
+        "RATE": float(os.getenv("SMS_RATE", 50)),
+        "BATCH_SIZE": int(os.getenv("SMS_BATCH_SIZE", 100)),
+        "SENDER": os.getenv("SMS_SENDER_ID", "WeddingRes"),
+        "OPTIONS": {"path": os.getenv("SMS_FILE_PATH", str(BASE_DIR / "utils" / "sms.log"))},
+    }
+}
+SMS_MAX_RETRIES = int(os.getenv("SMS_MAX_RETRIES", 3))
 
 SOCIALACCOUNT_PROVIDERS = {
     "google": {"APP": {"client_id": "123", "secret": "456", "key": ""}}
@@ -249,6 +309,45 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Card rendering
+# "pil" or "numpy". NumPy is an optional dependency, not installed by
+# `poetry install`: `pip install numpy` before choosing "numpy", which
+# otherwise falls back to "pil" with a warning.
+CARD_RASTER_BACKEND = os.getenv("CARD_RASTER_BACKEND", "pil")
+# Default card encoding: "png", "png-fast", "png-quantized", "webp" or "jpeg".
+# Events can override it with WeddingEvent.card_format.
+CARD_FORMAT = os.getenv("CARD_FORMAT", "png")
+# "eager" renders cards when guests are created, "lazy" on first view
+CARD_RENDER_MODE = os.getenv("CARD_RENDER_MODE", "eager")
+# Processes a batch render (bulk imports, re-renders after event edits)
+# draws its cards on; 0 uses every available CPU, 1 renders in-process.
+# The pool is started once per worker process and kept. Prefork children
+# can't start processes, so the card_render worker runs --pool=threads.
+CARD_RENDER_WORKERS = int(os.getenv("CARD_RENDER_WORKERS", 0))
+# QR codes: error correction "L", "M", "Q" or "H", and pixels per module
+# in the stored QR code images
+QR_ERROR_CORRECTION = os.getenv("QR_ERROR_CORRECTION", "M")
+QR_BOX_SIZE = int(os.getenv("QR_BOX_SIZE", 10))
+# Encode a short signed token (guest, event, expiry) instead of the
+# /verify/<uuid>/ URL; cards printed with either keep working. Tokens stay
+# valid for QR_TOKEN_GRACE_DAYS after the event date.
+QR_SIGNED_TOKENS = os.getenv("QR_SIGNED_TOKENS", "False") == "True"
+QR_TOKEN_GRACE_DAYS = int(os.getenv("QR_TOKEN_GRACE_DAYS", 2))
+# Region for phone numbers without a country code, both in bulk guest
+# imports and when texting guests
+PHONE_REGION = os.getenv("PHONE_REGION", "ZM")
+# Rendered cards keyed by a hash of their render inputs, evicted LRU once
+# MAX_BYTES is reached. BACKEND is "filesystem", "redis" or "" to disable.
+CARD_CACHE_BACKEND = os.getenv("CARD_CACHE_BACKEND", "filesystem")
+CARD_CACHE = {
+    "BACKEND": CARD_CACHE_BACKEND,
+    "LOCATION": os.getenv(
+        "CARD_CACHE_LOCATION",
+        REDIS_URL if CARD_CACHE_BACKEND == "redis" else BASE_DIR / "card_cache",
+    ),
+    "MAX_BYTES": int(os.getenv("CARD_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+}
+
 LOG_DIR = os.path.join(BASE_DIR, 'utils')
 os.makedirs(LOG_DIR, exist_ok=True)
 
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wedding_res.settings')
 
 application = get_wsgi_application()
+
+# Parse card fonts up front; with ``gunicorn --preload`` this runs once in
+# the master and the workers share the faces after forking.
+from utils.generators import warmup_fonts  # noqa: E402
+
+warmup_fonts()